@@ -1,12 +1,45 @@
 # pylint: disable=missing-docstring,import-outside-toplevel
-# Import functions/classes to make the public API
+import importlib
+
 from . import version
-from .registry import data_location
-from .etopo1 import fetch_etopo1
-from .prem import fetch_prem
-from .bedmap2 import fetch_bedmap2
-from .seafloor import fetch_seafloor_age
-from .slab2 import fetch_slab2
+
+# Functions/classes that make the public API and the modules that define them.
+# The modules (and their dependencies, like xarray, pandas and rasterio) are
+# only imported when the functions are first accessed.
+PUBLIC_API = {
+    "data_location": "registry",
+    "fetch_etopo1": "etopo1",
+    "fetch_prem": "prem",
+    "prem_at": "prem",
+    "fetch_bedmap2": "bedmap2",
+    "fetch_seafloor_age": "seafloor",
+    "fetch_slab2": "slab2",
+    "afetch_etopo1": "aio",
+    "afetch_prem": "aio",
+    "afetch_bedmap2": "aio",
+    "afetch_seafloor_age": "aio",
+    "afetch_slab2": "aio",
+    "prefetch": "bulk",
+    "sample": "sampling",
+    "enable_cache": "cache",
+    "disable_cache": "cache",
+    "cache_info": "cache",
+}
+
+
+def __getattr__(name):
+    "Import the public functions from their modules when first accessed"
+    if name not in PUBLIC_API:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    value = getattr(importlib.import_module("." + PUBLIC_API[name], __name__), name)
+    # Store it so that this function isn't called again for this name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()).union(PUBLIC_API))
+
 
 # Get the version number through versioneer
 __version__ = version.full_version
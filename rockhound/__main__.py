@@ -0,0 +1,114 @@
+"""
+Command line interface for managing the RockHound data directory.
+
+Run ``python -m rockhound --help`` for usage instructions.
+"""
+import sys
+import argparse
+
+from .bulk import prefetch, DATASETS
+
+
+def format_bytes(size):
+    "Format a number of bytes as a human readable string"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(size) < 1000:
+            break
+        size /= 1000
+    else:
+        unit = "TB"
+    return "{:.1f} {}".format(size, unit)
+
+
+def print_report(report, out=None):
+    "Print the report of a prefetch as a table"
+    if out is None:
+        out = sys.stdout
+    width = max([len("file")] + [len(fname) for fname in report["file"]])
+    template = "{:<{width}}  {:>10}  {:>9}  {:>12}  {}"
+    print(
+        template.format("file", "size", "time", "throughput", "status", width=width),
+        file=out,
+    )
+    for row in report.itertuples():
+        if row.error is not None:
+            status = "failed ({})".format(row.error)
+        elif row.downloaded:
+            status = "downloaded"
+        else:
+            status = "cached"
+        print(
+            template.format(
+                row.file,
+                format_bytes(row.size),
+                "{:.2f} s".format(row.seconds),
+                format_bytes(row.throughput) + "/s",
+                status,
+                width=width,
+            ),
+            file=out,
+        )
+    downloaded = report[report["downloaded"]]
+    print(
+        "Downloaded {} of {} files: {} ({} total in the data directory).".format(
+            len(downloaded),
+            len(report),
+            format_bytes(downloaded["size"].sum()),
+            format_bytes(report["size"].sum()),
+        ),
+        file=out,
+    )
+
+
+def main(argv=None):
+    """
+    Run the command line interface.
+
+    Parameters
+    ----------
+    argv : None or list
+        The command line arguments. If None, will use :data:`sys.argv`.
+
+    Returns
+    -------
+    status : int
+        The exit code of the program.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m rockhound",
+        description="Manage the RockHound data directory.",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    parser_prefetch = commands.add_parser(
+        "prefetch",
+        help="Download files from the registry concurrently.",
+        description="Download and process files from the registry concurrently.",
+    )
+    parser_prefetch.add_argument(
+        "datasets",
+        nargs="*",
+        help="Datasets ({}), registry files or wildcard patterns of file names. "
+        "Downloads the whole registry if omitted.".format(", ".join(DATASETS)),
+    )
+    parser_prefetch.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of files downloaded at the same time.",
+    )
+    args = parser.parse_args(argv)
+    try:
+        report = prefetch(datasets=args.datasets or None, workers=args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+    print_report(report)
+    if report["error"].notnull().any():
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
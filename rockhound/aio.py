@@ -0,0 +1,81 @@
+"""
+Asynchronous versions of the data fetching functions for use with asyncio.
+
+The ``afetch_*`` functions are generated from the entries of
+:data:`rockhound.PUBLIC_API` that are defined in this module. Each one runs the
+``fetch_*`` function of the same name (without the ``a``) in the default
+executor of the running event loop.
+"""
+import asyncio
+import functools
+import importlib
+
+from . import PUBLIC_API
+
+# Docstring of the asynchronous functions. {name} is the synchronous function.
+DOCSTRING = """
+    Run :func:`rockhound.{name}` without blocking the event loop.
+
+    Asynchronous version of :func:`rockhound.{name}`. The data are downloaded,
+    processed and loaded in a thread of the default executor of the running
+    event loop, so other tasks keep running in the meantime. Several calls can
+    be run concurrently with :func:`asyncio.gather`:
+
+    .. code:: python
+
+        grids = await asyncio.gather(
+            rockhound.a{name}(...), rockhound.a{name}(...)
+        )
+
+    Cancelling the task stops waiting for the result but not the download in
+    progress.
+
+    Parameters
+    ----------
+    args, kwargs
+        Positional and keyword arguments are passed to
+        :func:`rockhound.{name}`.
+
+    Returns
+    -------
+    result
+        The value returned by :func:`rockhound.{name}` (the loaded data or the
+        paths to the downloaded files).
+
+    """
+
+
+async def run_in_executor(name, *args, **kwargs):
+    """
+    Call the public function *name* in the default executor of the event loop.
+
+    The function is imported in the executor as well, so that importing its
+    dependencies for the first time doesn't block the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(call_public, name, args, kwargs)
+    return await loop.run_in_executor(None, call)
+
+
+def call_public(name, args, kwargs):
+    "Import the public function *name* and call it"
+    function = getattr(importlib.import_module(__package__), name)
+    return function(*args, **kwargs)
+
+
+def make_async(name):
+    """
+    Create the asynchronous version of the public function *name*.
+    """
+
+    async def function(*args, **kwargs):
+        return await run_in_executor(name, *args, **kwargs)
+
+    function.__name__ = function.__qualname__ = "a" + name
+    function.__module__ = __name__
+    function.__doc__ = DOCSTRING.format(name=name)
+    return function
+
+
+__all__ = [name for name, module in PUBLIC_API.items() if module == "aio"]
+globals().update({name: make_async(name[1:]) for name in __all__})
@@ -0,0 +1,60 @@
+"""
+Write files and directories atomically through uniquely named temporary paths.
+"""
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_output(path, *, directory=False):
+    """
+    Write a file or directory under a temporary name and move it to *path*.
+
+    Yields a unique temporary path in the same folder as *path*. The file
+    doesn't exist yet and must be created inside the ``with`` block
+    (directories are created empty). When the block finishes, the temporary
+    path is moved to *path* in a single operation. If the block raises an
+    exception, it's deleted instead. Interrupted writes never leave broken
+    files behind and several threads or processes can create the same file at
+    the same time without overwriting each other's partial output. The files
+    get the default permissions (unlike the ones created by :mod:`tempfile`),
+    so data directories can be shared between users.
+
+    Files replace *path* if it already exists. Directories can't replace an
+    existing directory, so the new one is deleted if another process created
+    *path* first.
+
+    Parameters
+    ----------
+    path : str
+        The final path of the file or directory.
+    directory : bool
+        If True, create a temporary directory instead of a file.
+
+    """
+    tmp = "{}.{}.tmp".format(os.path.abspath(path), uuid.uuid4().hex)
+    if directory:
+        os.mkdir(tmp)
+    try:
+        yield tmp
+    except BaseException:
+        remove(tmp)
+        raise
+    if not directory:
+        os.replace(tmp, path)
+        return
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another process finished the directory first
+        remove(tmp)
+
+
+def remove(path):
+    "Delete a file or directory if it exists"
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -4,9 +4,11 @@ Load the Bedmap2 datasets for Antarctica.
 import os
 
 import xarray as xr
-from pooch import Unzip
 
 from .registry import REGISTRY
+from .download import ResumableDownloader
+from .processors import UnzipMembers
+from .geotiff import open_geotiff, convert_to_cog
 
 DATASETS = {
     "bed": dict(name="Bedrock Height", units="meters"),
@@ -23,8 +25,25 @@ DATASETS = {
     "geoid": dict(name="Geoid Height (WGS84)", units="meters"),
 }
 
+# Paths to the files extracted from each archive (indexed by the path to the
+# archive) and the registry hash of the archive they were extracted from. Used
+# to avoid verifying and reading the archive every time the same datasets are
+# requested.
+FNAMES = {}
 
-def fetch_bedmap2(datasets, *, load=True, chunks=1000, **kwargs):
+
+def fetch_bedmap2(
+    datasets,
+    *,
+    load=True,
+    chunks="auto",
+    nodata="float32",
+    cog=False,
+    overview_level=None,
+    align="native",
+    interpolation="nearest",
+    **kwargs
+):
     """
     Fetch the Bedmap2 datasets for Antarctica.
 
@@ -32,7 +51,9 @@ def fetch_bedmap2(datasets, *, load=True, chunks=1000, **kwargs):
     ice-thickness, the sea floor and subglacial bed elevation of the Antarctic
     south of 60°S [BEDMAP2]_.
     The datasets are downloaded as ``tiff`` files and loaded into a
-    :class:`xarray.Dataset` object.
+    :class:`xarray.Dataset` object. Only the files of the requested datasets
+    are extracted from the downloaded zip archive. Interrupted downloads of the
+    archive are resumed instead of starting over.
 
     Each dataset is projected in Antarctic Polar Stereographic projection,
     latitude of true scale -71 degrees south, datum WGS84. All heights are in
@@ -66,7 +87,7 @@ def fetch_bedmap2(datasets, *, load=True, chunks=1000, **kwargs):
     .. warning ::
         Loading any dataset along with ``thickness_uncertainty_5km`` would
         modify the shape of the ``grid`` because it's defined on a different
-        set of points.
+        set of points (unless *align* is ``"upsample"`` or ``"separate"``).
 
     Parameters
     ----------
@@ -76,37 +97,113 @@ def fetch_bedmap2(datasets, *, load=True, chunks=1000, **kwargs):
         Whether to load the data into an :class:`xarray.Dataset` or just return
         the path to the downloaded data tiff files. If False, will return
         a list with the paths to the files corresponding to *datasets*.
-    chunks : int, tuple or dict
-        Chunk sizes along each dimension. This argument is passed to the
-        :func:`xarray.open_rasterio` function in order to obtain
+    chunks : None, str, int, tuple or dict
+        Chunk sizes along each dimension (``x`` and ``y``). Used to obtain
         `Dask arrays <https://docs.dask.org/en/latest/array.html>`_ inside the
         returned :class:`xarray.Dataset`.
         This helps to read the dataset without loading it entirely into memory.
+        Chunks are always multiples of the internal blocks of the files (sizes
+        are rounded up) so that each block is read only once. If ``"auto"``,
+        chunk sizes are chosen by Dask. If None, the datasets are read into
+        memory (in parallel). See :func:`rockhound.geotiff.open_geotiff`.
+    nodata : str
+        How to handle the no data values in the files. Can be ``"float32"`` or
+        ``"float64"`` to convert the datasets to floating point numbers of that
+        precision and replace the no data values with NaN. Or ``"native"`` to
+        keep the data type of the files (16-bit integers for some datasets) and
+        the no data values, which are recorded in the ``_FillValue`` attribute
+        of each dataset (they can be masked later with
+        :func:`xarray.decode_cf`). Both conversion and masking are done one
+        block at a time.
+    cog : bool
+        If True, convert the files into tiled and compressed `Cloud-Optimized
+        GeoTIFFs <https://www.cogeo.org>`__ with overviews (coarser versions of
+        the grids, each with half the resolution of the previous one). The
+        conversion is done only once and the new files are stored next to the
+        extracted files in the data directory. See
+        :func:`rockhound.geotiff.convert_to_cog`.
+    overview_level : None or int
+        Load an overview instead of the full resolution grids. Level 0 has half
+        the resolution, level 1 has a quarter, and so on. Implies
+        ``cog=True``. Much faster than loading the full grids for quick looks
+        and coarse analysis.
+    align : str
+        How to combine datasets defined on different grids (like
+        ``thickness_uncertainty_5km``, which has a 5 km spacing, and the other
+        datasets, which have 1 km). If ``"native"``, the datasets are merged
+        into a single grid with the union of all points (filled with NaN where
+        a dataset isn't defined). If ``"upsample"``, the datasets with coarser
+        spacing are interpolated onto the points of the finest grid. The
+        interpolation is done lazily (one chunk at a time) if *chunks* is not
+        None. If ``"separate"``, returns one :class:`xarray.Dataset` for each
+        grid without combining them.
+    interpolation : str
+        The interpolation method used if *align* is ``"upsample"``. Can be
+        ``"nearest"`` for the value of the nearest coarse grid point or
+        ``"bilinear"`` for bilinear interpolation (always returns floating
+        point numbers). Points outside of the coarse grid are NaN.
     **kwargs
-        Extra parameters passed to the :func:`xarray.open_rasterio` function.
+        Extra parameters passed to the :func:`rasterio.open` function.
 
     Returns
     -------
-    grid : :class:`xarray.Dataset`
-        The loaded Bedmap2 datasets.
+    grid : :class:`xarray.Dataset` or tuple
+        The loaded Bedmap2 datasets. If *align* is ``"separate"``, will be
+        a tuple of :class:`xarray.Dataset` (one for each grid, in the order
+        that the datasets were requested).
 
     """
     if isinstance(datasets, str):
         datasets = [datasets]
+    nodata_options = ["float32", "float64", "native"]
+    if nodata not in nodata_options:
+        raise ValueError(
+            "Invalid nodata option '{}'. Must be one of {}.".format(
+                nodata, nodata_options
+            )
+        )
+    align_options = ["native", "upsample", "separate"]
+    if align not in align_options:
+        raise ValueError(
+            "Invalid align option '{}'. Must be one of {}.".format(align, align_options)
+        )
+    interpolations = ["nearest", "bilinear"]
+    if interpolation not in interpolations:
+        raise ValueError(
+            "Invalid interpolation method '{}'. Must be one of {}.".format(
+                interpolation, interpolations
+            )
+        )
     if not set(datasets).issubset(DATASETS.keys()):
         raise ValueError(
             "Invalid datasets: {}".format(set(datasets).difference(DATASETS.keys()))
         )
-    fnames = REGISTRY.fetch("bedmap2_tiff.zip", processor=Unzip())
+    fnames = get_fnames(datasets)
+    if cog or overview_level is not None:
+        fnames = [
+            convert_to_cog(
+                fname,
+                os.path.splitext(fname)[0] + ".cog.tif",
+                # Masks have no units and should not be averaged
+                resampling="average" if "units" in DATASETS[dataset] else "nearest",
+            )
+            for dataset, fname in zip(datasets, fnames)
+        ]
     if not load:
-        return [get_fname(dataset, fnames) for dataset in datasets]
+        return fnames
+    if overview_level is not None:
+        kwargs["overview_level"] = overview_level
     arrays = []
-    for dataset in datasets:
-        array = xr.open_rasterio(get_fname(dataset, fnames), chunks=chunks, **kwargs)
-        # Replace no data values with nans
-        array = array.where(array != array.nodatavals)
-        # Remove "band" dimension and coordinate
-        array = array.squeeze("band", drop=True)
+    for dataset, fname in zip(datasets, fnames):
+        if nodata == "native":
+            array = open_geotiff(fname, chunks=chunks, **kwargs)
+            if array.nodatavals[0] is not None:
+                array.attrs["_FillValue"] = array.nodatavals[0]
+        else:
+            # Replace no data values with nans
+            array = open_geotiff(
+                fname, chunks=chunks, dtype=nodata, masked=True, **kwargs
+            )
         array.name = dataset
         array.x.attrs["units"] = "meters"
         array.y.attrs["units"] = "meters"
@@ -114,7 +211,19 @@ def fetch_bedmap2(datasets, *, load=True, chunks=1000, **kwargs):
         if "units" in DATASETS[dataset]:
             array.attrs["units"] = DATASETS[dataset]["units"]
         arrays.append(array)
-    grid = xr.merge(arrays)
+    if align == "separate":
+        groups = {}
+        for array in arrays:
+            groups.setdefault(grid_key(array), []).append(array)
+        return tuple(merge(group) for group in groups.values())
+    if align == "upsample":
+        arrays = upsample(arrays, interpolation)
+    return merge(arrays)
+
+
+def merge(arrays):
+    "Merge the arrays into a single Dataset and add the Bedmap2 metadata"
+    grid = xr.merge(arrays, join="outer")
     grid.attrs.update(
         {
             "title": "Bedmap2",
@@ -128,14 +237,81 @@ def fetch_bedmap2(datasets, *, load=True, chunks=1000, **kwargs):
     return grid
 
 
-def get_fname(dataset, fnames):
-    "Return the file name corresponding to the given dataset"
+def grid_key(array):
+    "Identify the grid of an array by its spacing, shape and origin"
+    return (tuple(array.attrs["res"]), array.shape, tuple(array.attrs["transform"]))
+
+
+def upsample(arrays, interpolation):
+    """
+    Interpolate the arrays defined on coarser grids onto the finest grid.
+
+    The finest grid is the largest grid with the smallest spacing. Arrays are
+    reindexed or interpolated by xarray, which is done lazily for Dask arrays
+    without creating intermediate copies of the whole grid. Points of the
+    finest grid outside of the coarser grids are NaN (nearest neighbor
+    interpolation only uses the coarse grid points up to half of the coarse
+    spacing away).
+    """
+    spacing = min(array.attrs["res"][0] for array in arrays)
+    reference = max(
+        (array for array in arrays if array.attrs["res"][0] == spacing),
+        key=lambda array: array.size,
+    )
+    upsampled = []
+    for array in arrays:
+        if array.attrs["res"][0] > spacing:
+            attrs = dict(array.attrs)
+            attrs["res"] = reference.attrs["res"]
+            attrs["transform"] = reference.attrs["transform"]
+            if interpolation == "nearest":
+                # Points outside of the cells of the coarse grid are NaN
+                array = array.reindex(
+                    x=reference.x,
+                    y=reference.y,
+                    method="nearest",
+                    tolerance=max(array.attrs["res"]) / 2,
+                )
+            else:
+                array = array.interp(x=reference.x, y=reference.y, method="linear")
+            array.attrs = attrs
+        upsampled.append(array)
+    return upsampled
+
+
+def member_name(dataset):
+    "Return the name of the file in the zip archive for the given dataset"
     if dataset == "geoid":
-        dataset_name = "gl04c_geiod_to_WGS84.tif"
-    else:
-        dataset_name = "bedmap2_{}.tif".format(dataset)
-    result = None
-    for fname in fnames:
-        if os.path.basename(fname) == dataset_name:
-            result = fname
-    return result
+        return "gl04c_geiod_to_WGS84.tif"
+    return "bedmap2_{}.tif".format(dataset)
+
+
+def get_fnames(datasets):
+    """
+    Return the paths to the extracted files of the given datasets.
+
+    Files are fetched and extracted from the archive only the first time
+    a dataset is requested. Later requests are answered from the :data:`FNAMES`
+    index without touching the archive, as long as the extracted files still
+    exist and the hash of the archive in the registry hasn't changed. When the
+    archive is downloaded again, the files extracted from the old one are
+    deleted (see :class:`~rockhound.processors.UnzipMembers`).
+    """
+    archive = os.path.join(str(REGISTRY.abspath), "bedmap2_tiff.zip")
+    known_hash = REGISTRY.registry["bedmap2_tiff.zip"]
+    if archive not in FNAMES or FNAMES[archive][0] != known_hash:
+        FNAMES[archive] = (known_hash, {})
+    index = FNAMES[archive][1]
+    missing = [
+        dataset
+        for dataset in datasets
+        if dataset not in index or not os.path.exists(index[dataset])
+    ]
+    if missing:
+        fnames = REGISTRY.fetch(
+            "bedmap2_tiff.zip",
+            processor=UnzipMembers([member_name(dataset) for dataset in missing]),
+            downloader=ResumableDownloader(fname="bedmap2_tiff.zip"),
+        )
+        index.update(zip(missing, fnames))
+    return [index[dataset] for dataset in datasets]
@@ -0,0 +1,153 @@
+"""
+Download the files in the registry in bulk to warm up the data directory.
+"""
+import os
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from pooch import Unzip
+
+from .download import ResumableDownloader, fetch_gunzip, read_hash
+from .processors import ParallelDecompress
+from .registry import REGISTRY, MAX_WORKERS
+
+# Patterns matching the registry files used by each dataset
+DATASETS = {
+    "etopo1": ["ETOPO1_*_g_gmt4.grd.gz"],
+    "prem": ["PREM_1s.csv"],
+    "bedmap2": ["bedmap2_tiff.zip"],
+    "seafloor_age": ["age.3.*.nc.bz2", "ageerror.3.*.nc.bz2"],
+    "slab2": ["*_slab2_*.grd"],
+}
+
+
+def prefetch(datasets=None, *, workers=None):
+    """
+    Download files from the registry concurrently.
+
+    Walks the files in the registry that match *datasets*, downloads the ones
+    that aren't in the data directory yet, and runs the same processing that
+    the ``fetch_*`` functions do (decompressing and unzipping archives). Use
+    this to populate an empty data directory in a single parallel step.
+    Gzipped files (ETOPO1) are decompressed while they are downloaded, like
+    :func:`rockhound.fetch_etopo1` does, so only the decompressed files are
+    kept.
+
+    Files that fail to download don't stop the others. Check the ``error``
+    column of the returned report to find out which ones failed.
+
+    Parameters
+    ----------
+    datasets : None, str or list
+        Which files to download. Can be the names of datasets (``"etopo1"``,
+        ``"prem"``, ``"bedmap2"``, ``"seafloor_age"``, ``"slab2"``), names of
+        files in the registry, or Unix shell-style wildcard patterns of file
+        names (like ``"alu_slab2_*"``). If None, will download all files in the
+        registry.
+    workers : None or int
+        Maximum number of files downloaded at the same time. If None, will use
+        :data:`rockhound.registry.MAX_WORKERS`.
+
+    Returns
+    -------
+    report : :class:`pandas.DataFrame`
+        One row per file with the columns: ``file`` (name in the registry),
+        ``path`` (local path to the fetched file or the processed output),
+        ``size`` (bytes on disk, of the decompressed file for gzipped
+        files), ``downloaded`` (whether the file had to be
+        downloaded), ``seconds`` (time spent fetching and processing),
+        ``throughput`` (bytes per second) and ``error`` (the error message or
+        None).
+
+    """
+    fnames = select_files(datasets)
+    if workers is None:
+        workers = MAX_WORKERS
+    if workers < 1:
+        raise ValueError("Invalid number of workers '{}'.".format(workers))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(fetch_timed, fnames))
+    columns = ["file", "path", "size", "downloaded", "seconds", "throughput", "error"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def select_files(datasets):
+    """
+    Get the registry files matching the given datasets, files or patterns.
+    """
+    fnames = REGISTRY.registry_files
+    if datasets is None:
+        return fnames
+    if isinstance(datasets, str):
+        datasets = [datasets]
+    selected = []
+    for name in datasets:
+        patterns = DATASETS.get(name, [name])
+        matches = [
+            fname
+            for fname in fnames
+            if any(fnmatch.fnmatchcase(fname, pattern) for pattern in patterns)
+        ]
+        if not matches:
+            raise ValueError(
+                "Invalid dataset '{}'. Must be one of {}, a file in the registry, "
+                "or a pattern matching files in the registry.".format(
+                    name, list(DATASETS)
+                )
+            )
+        selected.extend(fname for fname in matches if fname not in selected)
+    return selected
+
+
+def get_processor(fname):
+    """
+    Get the Pooch processor used by the ``fetch_*`` functions for a file.
+    """
+    if fname.endswith(".bz2"):
+        return ParallelDecompress()
+    if fname.endswith(".zip"):
+        return Unzip()
+    return None
+
+
+def fetch_timed(fname):
+    """
+    Fetch and process a file from the registry, measuring the time it takes.
+
+    Returns a dictionary with the row of the report for this file.
+    """
+    local = os.path.join(str(REGISTRY.abspath), fname)
+    gunzip = fname.endswith(".gz")
+    downloaded = not os.path.exists(local)
+    if gunzip:
+        known_hash = REGISTRY.registry[fname]
+        downloaded = downloaded and read_hash(local + ".decomp") != known_hash
+    start = time.perf_counter()
+    path, error = None, None
+    try:
+        if gunzip:
+            path = fetch_gunzip(REGISTRY, fname)
+        else:
+            path = REGISTRY.fetch(
+                fname,
+                processor=get_processor(fname),
+                downloader=ResumableDownloader(fname=fname),
+            )
+    except Exception as err:  # pylint: disable=broad-except
+        error = "{}: {}".format(type(err).__name__, err)
+    seconds = time.perf_counter() - start
+    if gunzip and not os.path.exists(local):
+        # Only the decompressed file is kept
+        local += ".decomp"
+    size = os.path.getsize(local) if os.path.exists(local) else 0
+    return dict(
+        file=fname,
+        path=path,
+        size=size,
+        downloaded=downloaded and error is None,
+        seconds=seconds,
+        throughput=size / seconds if seconds > 0 else float("nan"),
+        error=error,
+    )
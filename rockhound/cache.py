@@ -0,0 +1,265 @@
+"""
+In-memory cache of the loaded datasets.
+"""
+import functools
+import inspect
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Default size budget of the cache (1 Gb)
+MAX_BYTES = 2**30
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "max_bytes", "bytes", "size"])
+
+
+class LRUCache:
+    """
+    Thread-safe cache with a size budget in bytes and LRU eviction.
+
+    When adding an object would exceed the budget, the least recently used
+    objects are removed. Objects larger than the budget are not stored.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the stored objects in bytes.
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the object stored under *key* or None if it isn't cached.
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, obj, nbytes):
+        """
+        Store an object of *nbytes* under *key*, evicting old ones if needed.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            while self.entries and self.nbytes + nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+            self.entries[key] = (obj, nbytes)
+            self.nbytes += nbytes
+
+    def info(self):
+        "Return the hit and miss counters and current size of the cache"
+        with self.lock:
+            return CacheInfo(
+                self.hits, self.misses, self.max_bytes, self.nbytes, len(self.entries)
+            )
+
+
+# The cache used by the fetch functions. None means caching is disabled.
+CACHE = None
+
+
+def enable_cache(max_bytes=MAX_BYTES):
+    """
+    Keep the datasets loaded by the fetch functions in memory.
+
+    Once enabled, calling :func:`fetch_prem`, :func:`fetch_slab2` or
+    :func:`fetch_seafloor_age` again with the same arguments returns the
+    dataset from memory instead of reading and parsing the files again. Useful
+    for long running programs and services that load the same datasets many
+    times.
+
+    When the total size of the cached datasets exceeds *max_bytes*, the least
+    recently used ones are discarded. Cached data is read-only: each call
+    returns a new shallow copy that shares the read-only arrays, so adding or
+    changing variables and attributes doesn't affect the cache but modifying
+    the values in place raises an error (use ``.copy()`` for a writable copy).
+    Tables with columns of different data types can't be made read-only and
+    are copied on every call instead.
+
+    Only data loaded into memory is cached. Any variables that are still read
+    lazily from the files are loaded before caching, so the cache never keeps
+    files open. Calls that ask for lazily read data or Dask arrays (with
+    ``lazy=True`` or *chunks*) aren't cached.
+
+    Calling this function again replaces the cache with a new empty one.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum size of the cached datasets in bytes. Defaults to 1 Gb.
+
+    See also
+    --------
+    disable_cache, cache_info
+
+    """
+    global CACHE  # pylint: disable=global-statement
+    CACHE = LRUCache(max_bytes)
+
+
+def disable_cache():
+    """
+    Stop caching the loaded datasets and release the cached ones.
+
+    See also
+    --------
+    enable_cache, cache_info
+
+    """
+    global CACHE  # pylint: disable=global-statement
+    CACHE = None
+
+
+def cache_info():
+    """
+    Get the statistics of the cache of loaded datasets.
+
+    Returns
+    -------
+    info : namedtuple or None
+        The number of ``hits`` and ``misses``, the size budget (``max_bytes``),
+        the current size of the cached datasets (``bytes``), and the number of
+        cached datasets (``size``). None if the cache is disabled.
+
+    See also
+    --------
+    enable_cache, disable_cache
+
+    """
+    if CACHE is None:
+        return None
+    return CACHE.info()
+
+
+def cached(function):
+    """
+    Decorate a fetch function to use the cache of loaded datasets.
+
+    The cache key is the name of the function and the values of all of its
+    arguments (including defaults). Calls with ``load=False``, ``lazy=True``
+    or *chunks* other than None, with arguments that can't be hashed, or that
+    return objects other than xarray or pandas objects are not cached.
+    """
+    signature = inspect.signature(function)
+    name = "{}.{}".format(function.__module__, function.__qualname__)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        cache = CACHE
+        if cache is None:
+            return function(*args, **kwargs)
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        if not loads_in_memory(arguments.arguments):
+            return function(*args, **kwargs)
+        try:
+            key = (name, freeze(arguments.arguments))
+            hash(key)
+        except TypeError:
+            return function(*args, **kwargs)
+        obj = cache.get(key)
+        if obj is None:
+            obj = function(*args, **kwargs)
+            if not isinstance(obj, (xr.Dataset, xr.DataArray, pd.DataFrame)):
+                return obj
+            obj = read_only(obj)
+            cache.put(key, obj, nbytes(obj))
+        return copy_cached(obj)
+
+    return wrapper
+
+
+def freeze(value):
+    """
+    Convert lists and dictionaries (recursively) into tuples for hashing.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def loads_in_memory(arguments):
+    """
+    Check if a fetch function loads the data into memory given its arguments.
+
+    Returns False for calls that return file names (``load=False``), lazily
+    read data (``lazy=True``) or Dask arrays (*chunks* other than None).
+    """
+    return (
+        arguments.get("load", True)
+        and not arguments.get("lazy", False)
+        and arguments.get("chunks") is None
+    )
+
+
+def read_only(obj):
+    """
+    Load an xarray or pandas object into memory and make its arrays read-only.
+
+    Variables of xarray objects that are still read lazily from the files are
+    loaded first. DataFrames with a single data type are rebuilt on top of
+    a read-only array. DataFrames with several data types are left unchanged
+    (see :func:`copy_cached`).
+    """
+    if isinstance(obj, pd.DataFrame):
+        if len(set(obj.dtypes)) > 1:
+            return obj
+        values = obj.to_numpy()
+        values.flags.writeable = False
+        return pd.DataFrame(values, index=obj.index, columns=obj.columns, copy=False)
+    obj = obj.load()
+    for variable in variables(obj):
+        if isinstance(variable, xr.IndexVariable):
+            continue
+        if isinstance(variable.data, np.ndarray):
+            variable.data.flags.writeable = False
+    return obj
+
+
+def copy_cached(obj):
+    """
+    Return a copy of a cached object that can't modify the cache.
+
+    Shallow copies share the read-only arrays of the cached object.
+    DataFrames with several data types can't be made read-only so they are
+    copied deeply.
+    """
+    if isinstance(obj, pd.DataFrame) and len(set(obj.dtypes)) > 1:
+        return obj.copy(deep=True)
+    return obj.copy(deep=False)
+
+
+def nbytes(obj):
+    """
+    Return the size of an xarray or pandas object in bytes.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    return int(sum(variable.nbytes for variable in variables(obj)))
+
+
+def variables(obj):
+    "Return the variables of an xarray object, including the coordinates"
+    if isinstance(obj, xr.DataArray):
+        return [obj.variable, *obj.coords.variables.values()]
+    return list(obj.variables.values())
@@ -0,0 +1,496 @@
+"""
+Download files with resumable HTTP Range requests over pooled keep-alive
+connections and decompress compressed files while they are downloaded.
+"""
+import os
+import glob
+import queue
+import shutil
+import hashlib
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from pooch import Decompress, get_logger
+
+from .atomic import atomic_output
+
+# Size of the pieces of the file that are downloaded and decompressed at a time
+CHUNK_SIZE = 2**20
+# Maximum number of downloaded chunks waiting to be decompressed
+QUEUE_SIZE = 16
+# Seconds to wait for the server to respond
+TIMEOUT = 60
+# Number of times an interrupted download is resumed before giving up
+RETRIES = 5
+# Files are only split into parallel segments of at least this many bytes
+MIN_SEGMENT_SIZE = 16 * 2**20
+# Maximum number of idle connections kept open to each host
+POOL_SIZE = 32
+
+# Errors raised when a connection drops in the middle of a download
+CONNECTION_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.HTTPError,
+)
+
+# Locks of the partial files that are being downloaded in this process
+PARTIAL_LOCKS = {}
+PARTIAL_LOCKS_LOCK = threading.Lock()
+
+# Shared HTTP sessions indexed by process ID, URL scheme and host
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(url):
+    """
+    Get the shared HTTP session used to download files from the host of *url*.
+
+    There is one :class:`requests.Session` per host, created on first use. Its
+    connections are kept alive and returned to a pool (of up to
+    :data:`POOL_SIZE` connections) after each request, so fetching many files
+    from the same server pays for the TCP and TLS handshakes only once instead
+    of once per file. Sessions are safe to use from several threads. Child
+    processes create their own sessions instead of reusing the connections
+    inherited from the parent.
+
+    Parameters
+    ----------
+    url : str
+        The URL of a file that will be downloaded.
+
+    Returns
+    -------
+    session : :class:`requests.Session`
+        The session for the host of the URL.
+
+    """
+    parsed = urlparse(url)
+    key = (os.getpid(), parsed.scheme, parsed.netloc)
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_SIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            SESSIONS[key] = session
+    return session
+
+
+class ResumableDownloader:  # pylint: disable=too-few-public-methods
+    """
+    Pooch downloader that resumes interrupted downloads using HTTP ranges.
+
+    The data are written to a partial file in the data directory which is kept
+    if the download fails (see :func:`partial_file`). When the
+    download is interrupted, it's resumed from the end of the partial file
+    instead of starting over, both within the same call (up to
+    :data:`RETRIES` times) and in later calls. Servers that don't support
+    Range requests get a regular download. All requests to the same host
+    share a pool of keep-alive connections (see :func:`get_session`).
+
+    If *segments* is larger than 1, the size of the file is requested first
+    (with a HEAD request) and large files are downloaded in several segments
+    at the same time, each with its own partial file. If the server rejects
+    the HEAD request or doesn't send the size of the file, it's downloaded in
+    a single stream instead.
+
+    This is the default downloader of the rockhound registry for HTTP and HTTPS
+    URLs (with a single segment). Use it with other registries by passing an
+    instance to :meth:`pooch.Pooch.fetch`
+    (``downloader=ResumableDownloader()``).
+
+    Parameters
+    ----------
+    segments : int
+        Maximum number of byte ranges of a single file that are downloaded at
+        the same time. Segments have at least :data:`MIN_SEGMENT_SIZE` bytes.
+    retries : int
+        Number of times an interrupted download is resumed before giving up.
+    fname : None or str
+        The name of the file in the registry, used to name the partial files.
+        If None, it's found by searching the registry for the URL.
+
+    """
+
+    def __init__(self, segments=4, retries=RETRIES, fname=None):
+        if segments < 1:
+            raise ValueError("Invalid number of segments '{}'.".format(segments))
+        self.segments = segments
+        self.retries = retries
+        self.fname = fname
+
+    def __call__(self, url, output_file, pooch, check_only=False):
+        """
+        Download the file at *url* and save it to *output_file*.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the file.
+        output_file : str or file-like object
+            Where the downloaded data will be saved.
+        pooch : :class:`pooch.Pooch`
+            The instance of :class:`pooch.Pooch` that is calling this. The
+            partial files are saved in its data directory.
+        check_only : bool
+            If True, only check if the file is available on the server.
+
+        Returns
+        -------
+        available : bool or None
+            If *check_only*, whether the file is available. None otherwise.
+
+        """
+        if check_only:
+            return is_available(url)
+        size = 0
+        if self.segments > 1:
+            size = ranges_size(url)
+        part = partial_file(url, pooch, self.fname)
+        with PARTIAL_LOCKS_LOCK:
+            lock = PARTIAL_LOCKS.setdefault(part, threading.Lock())
+        # Downloads of the same file in other threads share the partial file
+        with lock:
+            self.download(url, output_file, part, size)
+        return None
+
+    def download(self, url, output_file, part, size):
+        """
+        Download the file to the partial file and move it to *output_file*.
+
+        *size* is the size of the file if the server supports Range requests
+        and 0 otherwise.
+        """
+        segments = min(self.segments, max(size // MIN_SEGMENT_SIZE, 1))
+        bounds = [size * i // segments for i in range(segments + 1)]
+        # Segment files are named after their byte ranges, so the segments of
+        # a download with different bounds are never reused
+        pieces = [
+            "{}.{}-{}".format(part, start, end)
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        for piece in glob.glob(glob.escape(part) + ".*-*"):
+            if segments == 1 or piece not in pieces:
+                os.remove(piece)
+        if segments > 1:
+            with ThreadPoolExecutor(max_workers=segments) as executor:
+                futures = [
+                    executor.submit(
+                        download_range, url, piece, start, end, self.retries
+                    )
+                    for piece, start, end in zip(pieces, bounds[:-1], bounds[1:])
+                ]
+            for future in futures:
+                future.result()
+            with open(part, "wb") as output:
+                for piece in pieces:
+                    with open(piece, "rb") as source:
+                        shutil.copyfileobj(source, output)
+            for piece in pieces:
+                os.remove(piece)
+        else:
+            download_resume(url, part, self.retries)
+        if hasattr(output_file, "write"):
+            with open(part, "rb") as source:
+                shutil.copyfileobj(source, output_file)
+            os.remove(part)
+        else:
+            os.replace(part, output_file)
+
+
+def is_available(url):
+    """
+    Check if a file is available on the server.
+
+    Uses a HEAD request and a streamed GET request (without reading the data)
+    if the server rejects the HEAD request.
+    """
+    session = get_session(url)
+    response = session.head(url, allow_redirects=True, timeout=TIMEOUT)
+    if response.status_code == 200:
+        return True
+    with session.get(url, stream=True, timeout=TIMEOUT) as response:
+        return response.status_code == 200
+
+
+def ranges_size(url):
+    """
+    Get the size of a file if the server supports Range requests for it.
+
+    Returns 0 if the server doesn't support ranges, doesn't send the size or
+    rejects the HEAD request.
+    """
+    try:
+        response = get_session(url).head(url, allow_redirects=True, timeout=TIMEOUT)
+    except CONNECTION_ERRORS:
+        return 0
+    if not response.ok or response.headers.get("Accept-Ranges") != "bytes":
+        return 0
+    return int(response.headers.get("Content-Length", 0))
+
+
+def partial_file(url, pooch, fname=None):
+    """
+    Get the path of the partial file used to download *url*.
+
+    The name is the registry file name *fname* followed by a digest of the URL
+    and the registry hash of the file and ending in ``.part``. URLs that only
+    differ in the query string (like the Slab2 files) get different partial
+    files and a partial file is never resumed after the hash in the registry
+    changes. If *fname* is None, the registry is searched for the URL (or the
+    last part of the URL is used if it's not in the registry).
+    """
+    if fname is None:
+        fname = registry_name(url, pooch)
+    if fname is None:
+        name, known_hash = os.path.basename(urlparse(url).path), ""
+    else:
+        name, known_hash = os.path.basename(fname), pooch.registry.get(fname) or ""
+    digest = hashlib.sha256("{} {}".format(url, known_hash).encode()).hexdigest()
+    return os.path.join(str(pooch.abspath), "{}.{}.part".format(name, digest[:16]))
+
+
+def registry_name(url, pooch):
+    "Find the name of the file with the given URL in the registry (or None)"
+    if url.startswith(pooch.base_url):
+        fname = url[len(pooch.base_url) :]
+        if fname in pooch.registry and fname not in pooch.urls:
+            return fname
+    for fname, file_url in pooch.urls.items():
+        if file_url == url and fname in pooch.registry:
+            return fname
+    return None
+
+
+def download_resume(url, fname, retries):
+    """
+    Download a whole file in a single stream, resuming from the partial file.
+
+    If *fname* already has data, only the rest of the file is requested with
+    a Range request. Servers that don't support ranges send the whole file,
+    which replaces the partial file.
+    """
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(fname) if os.path.exists(fname) else 0
+        if attempt > 0 and offset:
+            get_logger().info(
+                "Resuming the download of '%s' from byte %d.", url, offset
+            )
+        headers = {"Range": "bytes={}-".format(offset)} if offset else {}
+        session = get_session(url)
+        try:
+            with session.get(
+                url, headers=headers, stream=True, timeout=TIMEOUT
+            ) as response:
+                if response.status_code == 416:
+                    # The partial file isn't a prefix of the file
+                    os.remove(fname)
+                    continue
+                response.raise_for_status()
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(fname, mode) as output:
+                    for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                        output.write(chunk)
+            return
+        except CONNECTION_ERRORS:
+            if attempt == retries:
+                raise
+    raise OSError("Failed to download '{}' after {} attempts.".format(url, retries + 1))
+
+
+def download_range(url, fname, start, end, retries):
+    """
+    Download the bytes from *start* to *end* (exclusive) of a file.
+
+    The data are appended to *fname*, resuming from its current size.
+    """
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(fname) if os.path.exists(fname) else 0
+        if start + offset >= end:
+            return
+        if attempt > 0:
+            get_logger().info(
+                "Resuming the download of '%s' from byte %d.", url, start + offset
+            )
+        try:
+            headers = {"Range": "bytes={}-{}".format(start + offset, end - 1)}
+            download_stream(url, fname, headers, "ab")
+        except CONNECTION_ERRORS:
+            if attempt == retries:
+                raise
+    if start + os.path.getsize(fname) < end:
+        raise OSError(
+            "Failed to download '{}' after {} attempts.".format(url, retries + 1)
+        )
+
+
+def download_stream(url, fname, headers, mode):
+    "Stream the response of a GET request to a file opened with *mode*"
+    session = get_session(url)
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if "Range" in headers and response.status_code != 206:
+            raise ValueError(
+                "Server of '{}' doesn't support Range requests.".format(url)
+            )
+        with open(fname, mode) as output:
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                output.write(chunk)
+
+
+def fetch_gunzip(registry, fname):
+    """
+    Fetch a gzip compressed file from the registry decompressing it on the fly.
+
+    The download and the decompression are pipelined: one thread downloads the
+    compressed data while another decompresses it and writes it to disk. If
+    the connection drops, the download is resumed with an HTTP Range request
+    instead of starting over. The
+    hash of the compressed data is calculated as it arrives and checked against
+    the registry. The compressed file is never saved to disk.
+
+    The decompressed file has the same name as the one created by
+    :class:`pooch.Decompress` (the file name followed by ``.decomp``). The hash
+    of the compressed file is stored next to it (in a file ending in
+    ``.hash``) so that the file is downloaded again if the registry changes.
+    If the compressed file was already downloaded by :meth:`pooch.Pooch.fetch`,
+    it's decompressed by Pooch instead.
+
+    Parameters
+    ----------
+    registry : :class:`pooch.Pooch`
+        The registry with the URL and hash of the file.
+    fname : str
+        The name of the file in the registry.
+
+    Returns
+    -------
+    fname : str
+        The full path of the decompressed file.
+
+    """
+    path = os.path.join(str(registry.abspath), fname)
+    output = path + ".decomp"
+    known_hash = registry.registry[fname]
+    if os.path.exists(output) and read_hash(output) == known_hash:
+        return output
+    if os.path.exists(path):
+        return registry.fetch(fname, processor=Decompress())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    url = registry.urls.get(fname, registry.base_url + fname)
+    get_logger().info(
+        "Downloading and decompressing file '%s' from '%s' to '%s'.",
+        fname,
+        url,
+        output,
+    )
+    with atomic_output(output) as tmp:
+        digest = download_gunzip(url, tmp, known_hash)
+        if digest != known_hash.split(":")[-1].lower():
+            raise ValueError(
+                "Hash of downloaded file '{}' ({}) ".format(fname, digest)
+                + "doesn't match the known hash {}.".format(known_hash)
+            )
+    with atomic_output(output + ".hash") as tmp:
+        with open(tmp, "w") as hash_file:
+            hash_file.write(known_hash)
+    return output
+
+
+def read_hash(output):
+    "Read the hash of the compressed file stored next to a decompressed file"
+    if not os.path.exists(output + ".hash"):
+        return None
+    with open(output + ".hash") as hash_file:
+        return hash_file.read().strip()
+
+
+def download_gunzip(url, output, known_hash):
+    """
+    Download and decompress a gzip file at the same time.
+
+    The download runs in a separate thread that passes the compressed chunks
+    through a bounded queue. Interrupted downloads are resumed from the last
+    byte received (up to :data:`RETRIES` times) without restarting the
+    decompression. Returns the hex digest of the compressed data
+    calculated with the algorithm of *known_hash* (SHA256 by default).
+    """
+    algorithm = known_hash.split(":")[0] if ":" in known_hash else "sha256"
+    hasher = hashlib.new(algorithm)
+    chunks = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+
+    def download():
+        "Put the compressed chunks in the queue (None marks the end)"
+        received = 0
+        try:
+            for attempt in range(RETRIES + 1):
+                # Resume interrupted downloads from the last byte received
+                headers = {"Range": "bytes={}-".format(received)} if received else {}
+                try:
+                    with get_session(url).get(
+                        url, headers=headers, stream=True, timeout=TIMEOUT
+                    ) as response:
+                        response.raise_for_status()
+                        if received and response.status_code != 206:
+                            raise ValueError(
+                                "Can't resume the download of '{}'. ".format(url)
+                                + "Server doesn't support Range requests."
+                            )
+                        for chunk in response.raw.stream(
+                            CHUNK_SIZE, decode_content=False
+                        ):
+                            if stop.is_set():
+                                return
+                            chunks.put(chunk)
+                            received += len(chunk)
+                    return
+                except CONNECTION_ERRORS:
+                    if attempt == RETRIES:
+                        raise
+                get_logger().info(
+                    "Resuming the download of '%s' from byte %d.", url, received
+                )
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+        finally:
+            chunks.put(None)
+
+    thread = threading.Thread(target=download, daemon=True)
+    thread.start()
+    try:
+        # 16 + MAX_WBITS tells zlib to expect the gzip header
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        with open(output, "wb") as destination:
+            for chunk in iter(chunks.get, None):
+                hasher.update(chunk)
+                while chunk:
+                    destination.write(decompressor.decompress(chunk))
+                    chunk = b""
+                    if decompressor.eof:
+                        # Several gzip members can be concatenated in a file
+                        chunk = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            destination.write(decompressor.flush())
+    finally:
+        stop.set()
+        # Make sure the download thread isn't blocked on a full queue
+        while thread.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+    if errors:
+        raise errors[0]
+    return hasher.hexdigest()
@@ -1,13 +1,39 @@
 """
 Load the ETOPO1 Earth Relief dataset.
 """
+# pylint: disable=redefined-builtin
+import os
+
+import numpy as np
 import xarray as xr
-from pooch import Decompress
 
+from .atomic import atomic_output
+from .download import fetch_gunzip
 from .registry import REGISTRY
+from .utils import subset_region, file_chunks
+
+# Chunk shape of the Zarr stores (about 11 Mb of 32-bit integers per chunk)
+ZARR_CHUNKS = {"latitude": 1200, "longitude": 2400}
 
+# Number of grid points along each dimension that are reduced together to
+# create the coarser versions of the grids
+RESOLUTIONS = {"1min": 1, "4min": 4, "15min": 15, "1deg": 60}
+# Number of rows of the original grid read at a time to create the coarser
+# grids (a multiple of all numbers of points above)
+BAND_ROWS = 120
 
-def fetch_etopo1(version, *, load=True, **kwargs):
+
+def fetch_etopo1(
+    version,
+    *,
+    load=True,
+    format="netcdf",
+    region=None,
+    resolution="1min",
+    reduction="mean",
+    chunks=None,
+    **kwargs
+):
     """
     Fetch the ETOPO1 global relief model.
 
@@ -23,6 +49,15 @@ def fetch_etopo1(version, *, load=True, **kwargs):
 
     If the files aren't already in your data directory, they will be downloaded
     automatically (which may take a while). Each grid is approximately 380Mb.
+    The files are decompressed while they are downloaded, so only the
+    decompressed grids are saved to disk.
+
+    The grids can optionally be converted into chunked and compressed `Zarr
+    <https://zarr.readthedocs.io>`__ stores (requires the ``zarr`` package).
+    The conversion happens only once and the store is kept in the data
+    directory. Opening the store is almost instantaneous and the data is only
+    read when needed, one chunk at a time, which is ideal for parallel
+    computations with Dask.
 
     Parameters
     ----------
@@ -32,9 +67,46 @@ def fetch_etopo1(version, *, load=True, **kwargs):
     load : bool
         Whether to load the data into an :class:`xarray.Dataset` or just return
         the path to the downloaded data.
+    format : str
+        Which file format to read the grid from. Can be ``"netcdf"`` for the
+        decompressed netCDF file or ``"zarr"`` for the Zarr store (created from
+        the netCDF file on first use). Zarr grids are loaded lazily as Dask
+        arrays.
+    region : None or tuple
+        Only load the part of the grid inside the region ``(west, east, south,
+        north)`` (in degrees). Only the rows and columns inside the region are
+        read from the file, which is a lot faster and uses less memory than
+        loading the whole grid. Regions can cross the antimeridian (``west >
+        east``). If None, will load the whole grid.
+    resolution : str
+        The grid spacing. Can be ``"1min"`` for the original grid or
+        ``"4min"``, ``"15min"``, or ``"1deg"`` for coarser versions. The
+        coarser grids are calculated from the original grid by reducing blocks
+        of grid points (4x4, 15x15, or 60x60 grid cells, including the points
+        on their edges) into a single value located exactly at the center of
+        the block (like -179.5 degrees at 1 degree resolution). The first and
+        last rows and columns of the coarse grid include the points at the
+        poles and at -180 and 180 degrees longitude. The coarse grids are
+        calculated only once and stored next
+        to the original grid in the data directory. Coarse grids are only
+        available in netCDF format.
+    reduction : str
+        How blocks of grid points are reduced into the coarser grids. Can be
+        ``"mean"`` or ``"median"``. Ignored if *resolution* is ``"1min"``.
+    chunks : None, str, int, tuple or dict
+        Load the grid as
+        `Dask arrays <https://docs.dask.org/en/latest/array.html>`__ with
+        these chunk sizes. Dictionaries can use the dimension names
+        ``longitude`` and ``latitude``. If ``"auto"``, chunks will be whole
+        rows of the grid (matching the layout of the files) with a number of
+        rows chosen by Dask. The grid are then only read when needed, one
+        chunk at a time, and all processing done by this function is delayed.
+        If None, will not use Dask.
+        Zarr stores are always loaded with Dask and use the chunks of the store
+        if None or ``"auto"``.
     kwargs
         Keyword arguments will be forwarded to the :func:`xarray.open_dataset`
-        function that loads the grid into memory.
+        or :func:`xarray.open_zarr` function that loads the grid.
 
     Returns
     -------
@@ -49,11 +121,58 @@ def fetch_etopo1(version, *, load=True, **kwargs):
     }
     if version not in available:
         raise ValueError("Invalid ETOPO1 version '{}'.".format(version))
-    fname = REGISTRY.fetch(available[version], processor=Decompress())
+    formats = ["netcdf", "zarr"]
+    if format not in formats:
+        raise ValueError(
+            "Invalid ETOPO1 format '{}'. Must be one of {}.".format(format, formats)
+        )
+    if resolution not in RESOLUTIONS:
+        raise ValueError(
+            "Invalid ETOPO1 resolution '{}'. Must be one of {}.".format(
+                resolution, list(RESOLUTIONS)
+            )
+        )
+    reductions = ["mean", "median"]
+    if reduction not in reductions:
+        raise ValueError(
+            "Invalid ETOPO1 reduction '{}'. Must be one of {}.".format(
+                reduction, reductions
+            )
+        )
+    if resolution != "1min" and format != "netcdf":
+        raise ValueError(
+            "Invalid ETOPO1 format '{}' for resolution '{}'. ".format(
+                format, resolution
+            )
+            + "Coarse grids are only available in netCDF format."
+        )
+    fname = fetch_gunzip(REGISTRY, available[version])
+    if format == "zarr":
+        fname = convert_to_zarr(fname, version)
+    elif resolution != "1min":
+        fname = downsample(fname, version, resolution, reduction)
     if not load:
         return fname
-    grid = xr.open_dataset(fname, **kwargs)
-    # Add more metadata and fix some names
+    if format == "zarr":
+        if chunks is not None and chunks != "auto":
+            kwargs["chunks"] = chunks
+        grid = xr.open_zarr(fname, **kwargs)
+    elif resolution != "1min":
+        dims = {"longitude": "longitude", "latitude": "latitude"}
+        grid = xr.open_dataset(fname, chunks=file_chunks(chunks, dims), **kwargs)
+    else:
+        grid = add_metadata(
+            xr.open_dataset(fname, chunks=file_chunks(chunks), **kwargs), version
+        )
+    if region is not None:
+        grid = subset_region(grid, region)
+    return grid
+
+
+def add_metadata(grid, version):
+    """
+    Rename the variables and add metadata to the grid read from netCDF.
+    """
     names = {"ice": "Ice Surface", "bedrock": "Bedrock"}
     grid = grid.rename(z=version, x="longitude", y="latitude")
     grid[version].attrs["long_name"] = "{} relief".format(names[version])
@@ -63,3 +182,96 @@ def fetch_etopo1(version, *, load=True, **kwargs):
     grid.attrs["title"] = "ETOPO1 {} Relief".format(names[version])
     grid.attrs["doi"] = "10.7289/V5C8276M"
     return grid
+
+
+def convert_to_zarr(fname, version):
+    """
+    Convert the decompressed netCDF grid into a Zarr store.
+
+    The store is created next to the netCDF file and includes the same names
+    and metadata as the grids returned by :func:`fetch_etopo1`. Does nothing if
+    the store already exists. The store is written to a uniquely named
+    temporary directory first, so several processes can run the conversion at
+    the same time.
+
+    Returns the path to the Zarr store.
+    """
+    store = fname.split(".grd")[0] + ".zarr"
+    if os.path.exists(store):
+        return store
+    chunks = {"y": ZARR_CHUNKS["latitude"], "x": ZARR_CHUNKS["longitude"]}
+    with xr.open_dataset(fname, chunks=chunks) as grid:
+        grid = add_metadata(grid, version)
+        for variable in grid.variables.values():
+            variable.encoding = {}
+        with atomic_output(store, directory=True) as tmp:
+            grid.to_zarr(tmp, mode="w")
+    return store
+
+
+def downsample(fname, version, resolution, reduction):
+    """
+    Calculate a coarser version of the decompressed netCDF grid.
+
+    Blocks of grid points are reduced into a single 32-bit float value. The
+    grid is read in bands of :data:`BAND_ROWS` rows at a time, so the original
+    grid is never loaded entirely into memory. The coarse grid is saved to
+    a netCDF file next to the original grid and includes the same names and
+    metadata as the grids returned by :func:`fetch_etopo1`. Does nothing if
+    the file already exists. Like the Zarr stores, the file is written under
+    a unique temporary name first.
+
+    The original grid is grid-line registered (it has a row at each pole and
+    a column at both -180 and 180 degrees). Each block has the points on its
+    edges as well (``factor + 1`` points in each direction), so the points on
+    the edges between blocks belong to both and the coarse grid points are
+    exactly at the centers of the blocks (like -179.5 degrees at 1 degree
+    resolution).
+
+    Returns the path to the coarse grid file.
+    """
+    output = "{}_{}_{}.nc".format(fname.split(".grd")[0], resolution, reduction)
+    if os.path.exists(output):
+        return output
+    factor = RESOLUTIONS[resolution]
+    with xr.open_dataset(fname) as grid:
+        grid = add_metadata(grid, version)
+        coords = {}
+        for dim in ("latitude", "longitude"):
+            edges = grid[dim].values[::factor]
+            coords[dim] = (dim, (edges[:-1] + edges[1:]) / 2, grid[dim].attrs)
+        values = np.empty(
+            (coords["latitude"][1].size, coords["longitude"][1].size), dtype="float32"
+        )
+        longitudes = block_indices(grid.longitude.size, factor)
+        for start in range(0, grid.latitude.size - 1, BAND_ROWS):
+            # Include the first row of the next band, shared by the blocks
+            band = grid[version][start : start + BAND_ROWS + 1].values
+            latitudes = block_indices(band.shape[0], factor)
+            blocks = band[np.ix_(latitudes, longitudes)].reshape(
+                latitudes.size // (factor + 1), factor + 1, -1, factor + 1
+            )
+            rows = slice(start // factor, start // factor + blocks.shape[0])
+            values[rows] = getattr(np, reduction)(blocks, axis=(1, 3))
+        coarse = xr.Dataset(
+            {version: (("latitude", "longitude"), values, grid[version].attrs)},
+            coords=coords,
+            attrs=grid.attrs,
+        )
+        coarse.attrs["resolution"] = resolution
+        coarse.attrs["reduction"] = reduction
+        with atomic_output(output) as tmp:
+            coarse.to_netcdf(tmp)
+    return output
+
+
+def block_indices(size, factor):
+    """
+    Get the indices of the points in each block along a dimension of the grid.
+
+    Each block has *factor* + 1 points and shares its first and last points
+    with the previous and next blocks. Points after the last full block are
+    left out.
+    """
+    starts = np.arange((size - 1) // factor) * factor
+    return (starts[:, np.newaxis] + np.arange(factor + 1)).ravel()
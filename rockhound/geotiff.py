@@ -0,0 +1,263 @@
+"""
+Read GeoTIFF files into xarray using windowed reads aligned to the file blocks
+and convert them into Cloud-Optimized GeoTIFFs.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+import xarray as xr
+import dask.array as da
+
+# Target size of each chunk when chunks are chosen automatically. Small enough
+# that grids are split into many chunks that can be read in parallel.
+CHUNK_SIZE = 16 * 2**20
+
+# Size of the square tiles of the Cloud-Optimized GeoTIFFs
+COG_BLOCKSIZE = 512
+# Overviews are created until their largest dimension is smaller than this
+COG_OVERVIEW_SIZE = 256
+
+
+def open_geotiff(fname, *, chunks="auto", dtype=None, masked=False, **kwargs):
+    """
+    Load the first band of a GeoTIFF file into an :class:`xarray.DataArray`.
+
+    The file is read with :mod:`rasterio` through windowed reads. The grid is
+    split into chunks whose boundaries are aligned with the internal blocks
+    (strips or tiles) of the file, so that no block is read and decoded more
+    than once. Chunks are read in parallel by Dask, each thread using its own
+    file handle.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the GeoTIFF file.
+    chunks : None, str, int, tuple or dict
+        Chunk sizes along each dimension (``y`` and ``x``). If ``"auto"``, the
+        sizes are chosen by Dask as multiples of the blocks of the file. Other
+        sizes are rounded up to the nearest multiple of the blocks. If None,
+        the grid is read in parallel into a :class:`numpy.ndarray` instead of
+        a Dask array.
+    dtype : None, str or numpy dtype
+        Convert the grid to this data type. If None, will keep the data type of
+        the file. The conversion is done one block at a time, so no full copy
+        of the grid is created in a different data type.
+    masked : bool
+        If True, replace the no data values with NaN. The grid must have
+        a floating point *dtype*. Masking is also done one block at a time.
+    **kwargs
+        Extra parameters passed to :func:`rasterio.open`.
+
+    Returns
+    -------
+    grid : :class:`xarray.DataArray`
+        The grid with dimensions ``y`` and ``x`` and coordinates at the center
+        of the pixels. The attributes include the coordinate reference system
+        (``crs``), the affine ``transform``, the resolution (``res``) and the
+        no data values (``nodatavals``). The files opened to read a Dask array
+        are closed when the grid is closed (:meth:`xarray.DataArray.close`) or
+        garbage collected.
+
+    """
+    # Imported here because rasterio (and GDAL) are slow to import
+    import rasterio  # pylint: disable=import-outside-toplevel
+
+    with rasterio.open(fname, **kwargs) as source:
+        shape = source.shape
+        nodata = source.nodata
+        if dtype is None:
+            dtype = source.dtypes[0]
+        blocks = source.block_shapes[0]
+        transform = source.transform
+        attrs = {
+            "transform": tuple(transform)[:6],
+            "crs": source.crs.to_string() if source.crs is not None else "",
+            "res": source.res,
+            "nodatavals": source.nodatavals[:1],
+        }
+    dtype = np.dtype(dtype)
+    if masked and not np.issubdtype(dtype, np.floating):
+        raise ValueError(
+            "Can't mask no data values with data type '{}'. ".format(dtype)
+            + "Must be a floating point type."
+        )
+    reader = WindowedReader(fname, shape, dtype, nodata if masked else None, kwargs)
+    data = da.from_array(
+        reader,
+        chunks=aligned_chunks(
+            "auto" if chunks is None else chunks, shape, dtype, blocks
+        ),
+        lock=False,
+        asarray=True,
+        name="open_geotiff-{}".format(da.core.tokenize(fname, dtype, masked, kwargs)),
+    )
+    if chunks is None:
+        data = data.compute(scheduler="threads")
+        reader.close()
+    x = transform.c + transform.a * (np.arange(shape[1]) + 0.5)
+    y = transform.f + transform.e * (np.arange(shape[0]) + 0.5)
+    grid = xr.DataArray(data, coords={"y": y, "x": x}, dims=("y", "x"), attrs=attrs)
+    grid.set_close(reader.close)
+    return grid
+
+
+def aligned_chunks(chunks, shape, dtype, blocks):
+    """
+    Calculate chunk sizes that are multiples of the blocks of the file.
+    """
+    if isinstance(chunks, dict):
+        chunks = tuple(chunks.get(dim, "auto") for dim in ("y", "x"))
+    elif np.isscalar(chunks) and not isinstance(chunks, str):
+        chunks = (chunks, chunks)
+    if isinstance(chunks, tuple):
+        chunks = tuple(
+            size if size in ("auto", -1, None) else int(np.ceil(size / block)) * block
+            for size, block in zip(chunks, blocks)
+        )
+    return da.core.normalize_chunks(
+        chunks, shape, dtype=dtype, previous_chunks=blocks, limit=CHUNK_SIZE
+    )
+
+
+class WindowedReader:  # pylint: disable=too-few-public-methods
+    """
+    Array-like object that reads windows of the first band of a raster file.
+
+    Each thread opens its own :mod:`rasterio` dataset because they can't be
+    shared between threads. Windows are converted to *dtype* and, if *nodata*
+    is not None, values equal to it are replaced with NaN.
+
+    All datasets opened by the threads are closed by :meth:`close` or when the
+    reader is garbage collected. Reading after closing opens them again.
+    """
+
+    def __init__(self, fname, shape, dtype, nodata, kwargs):
+        self.fname = fname
+        self.shape = shape
+        self.dtype = dtype
+        self.nodata = nodata
+        self.ndim = len(shape)
+        self.kwargs = kwargs
+        self.setup()
+
+    def setup(self):
+        "Create the thread-local storage and the list of open datasets"
+        self.local = threading.local()
+        self.sources = []
+        self.lock = threading.Lock()
+        # Doesn't reference the reader so that it can be garbage collected
+        self.finalizer = weakref.finalize(self, close_sources, self.sources, self.lock)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("local", "sources", "lock", "finalizer"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.setup()
+
+    def close(self):
+        "Close the datasets opened by all threads"
+        close_sources(self.sources, self.lock)
+
+    def __getitem__(self, index):
+        # Imported here because rasterio (and GDAL) are slow to import
+        import rasterio  # pylint: disable=import-outside-toplevel
+        from rasterio.windows import Window  # pylint: disable=import-outside-toplevel
+
+        rows, columns = (
+            range(*item.indices(size)) for item, size in zip(index, self.shape)
+        )
+        source = getattr(self.local, "source", None)
+        if source is None or source.closed:
+            source = rasterio.open(self.fname, **self.kwargs)
+            self.local.source = source
+            with self.lock:
+                self.sources.append(source)
+        window = Window(columns.start, rows.start, len(columns), len(rows))
+        block = source.read(1, window=window).astype(self.dtype, copy=False)
+        if self.nodata is not None:
+            block[block == self.nodata] = np.nan
+        return block
+
+
+def close_sources(sources, lock):
+    "Close the rasterio datasets in the list and empty it"
+    with lock:
+        closing = list(sources)
+        sources.clear()
+    for source in closing:
+        source.close()
+
+
+def convert_to_cog(fname, output, *, resampling="average"):
+    """
+    Convert a GeoTIFF file into a Cloud-Optimized GeoTIFF with overviews.
+
+    The new file is tiled (with square tiles of :data:`COG_BLOCKSIZE` pixels),
+    compressed, and includes overviews that reduce the resolution by powers of
+    two (2, 4, 8, ...) until their largest dimension is smaller than
+    :data:`COG_OVERVIEW_SIZE`. Overviews can be read directly by passing
+    ``overview_level`` to :func:`open_geotiff` (0 is the first overview).
+    Does nothing if *output* already exists.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the original GeoTIFF file.
+    output : str
+        Path to the new Cloud-Optimized GeoTIFF file.
+    resampling : str
+        Resampling method used to calculate the overviews. Can be any of the
+        methods in :class:`rasterio.enums.Resampling`, like ``"average"`` or
+        ``"nearest"`` (better for masks).
+
+    Returns
+    -------
+    output : str
+        The path to the new file.
+
+    """
+    # pylint: disable=import-outside-toplevel
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+
+    if os.path.exists(output):
+        return output
+    folder = os.path.dirname(os.path.abspath(output))
+    tmpdir = tempfile.mkdtemp(dir=folder)
+    try:
+        # Build the overviews in a copy of the original file and then copy
+        # everything to a tiled file with the overviews at the end
+        tmp = os.path.join(tmpdir, "overviews.tif")
+        shutil.copyfile(fname, tmp)
+        with rasterio.open(tmp, "r+") as source:
+            factors = []
+            factor = 2
+            while max(source.shape) // factor >= COG_OVERVIEW_SIZE:
+                factors.append(factor)
+                factor *= 2
+            if factors:
+                source.build_overviews(factors, Resampling[resampling])
+        tiled = os.path.join(tmpdir, "tiled.tif")
+        rasterio.shutil.copy(
+            tmp,
+            tiled,
+            driver="GTiff",
+            tiled=True,
+            blockxsize=COG_BLOCKSIZE,
+            blockysize=COG_BLOCKSIZE,
+            compress="deflate",
+            copy_src_overviews=True,
+        )
+        os.replace(tiled, output)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return output
@@ -1,13 +1,37 @@
 """
 Load the Preliminary Reference Earth Model (PREM) dataset.
 """
+import os
+
 import pandas as pd
 import numpy as np
 
+from .atomic import atomic_output
+from .cache import cached
 from .registry import REGISTRY
 
+COLUMNS = [
+    "radius",
+    "depth",
+    "density",
+    "Vpv",
+    "Vph",
+    "Vsv",
+    "Vsh",
+    "eta",
+    "Q_mu",
+    "Q_kappa",
+]
+
+# Columns added to the table by fetch_prem(derived=True)
+DERIVED_COLUMNS = ["mass", "gravity", "pressure", "bulk_modulus", "shear_modulus"]
+
+# Gravitational constant in m³/(kg s²)
+GRAVITATIONAL_CONSTANT = 6.67430e-11
+
 
-def fetch_prem(*, load=True):
+@cached
+def fetch_prem(*, load=True, derived=False):
     r"""
     Fetch the Preliminary Reference Earth Model (PREM).
 
@@ -21,13 +45,22 @@ def fetch_prem(*, load=True):
     objects.
 
     If the file isn't already in your data directory, it will be downloaded
-    automatically.
+    automatically. The parsed table is saved in binary format next to the csv
+    file, so only the first call parses the text file.
 
     Parameters
     ----------
     load : bool
         Whether to load the data into a :class:`pandas.DataFrame` or just
         return the path to the downloaded data.
+    derived : bool
+        If True, add columns with profiles derived from the density and seismic
+        velocities: the mass inside each radius, the gravity acceleration, the
+        hydrostatic pressure, and the bulk and shear moduli. Mass, gravity and
+        pressure are integrated over radius with the trapezoidal rule (within
+        each layer). The moduli are calculated from the Voigt average of the
+        velocities. The derived columns are calculated only once and cached
+        next to the parsed table.
 
     Returns
     -------
@@ -39,22 +72,133 @@ def fetch_prem(*, load=True):
         - ``density`` in g/cm³.
         - ``Vpv``, ``Vph``, ``Vsv`` and ``Vsh`` in km/s.
         - ``eta``, ``Q_mu`` and ``Q_kappa`` (dimensionless).
+        - If *derived* is True: ``mass`` in kg, ``gravity`` in m/s²,
+          ``pressure``, ``bulk_modulus`` and ``shear_modulus`` in GPa.
     """
     fname = REGISTRY.fetch("PREM_1s.csv")
     if not load:
         return fname
-    data = np.loadtxt(fname, delimiter=",")
-    columns = [
-        "radius",
-        "depth",
-        "density",
-        "Vpv",
-        "Vph",
-        "Vsv",
-        "Vsh",
-        "eta",
-        "Q_mu",
-        "Q_kappa",
-    ]
-    prem = pd.DataFrame(data=data, columns=columns)
-    return prem
+    columns = COLUMNS + DERIVED_COLUMNS if derived else COLUMNS
+    return pd.DataFrame(
+        data=load_table(fname, derived=derived), columns=columns, copy=False
+    )
+
+
+def load_table(fname, derived=False):
+    """
+    Load the PREM table from its binary cache, creating the cache if needed.
+
+    The parsed table is saved to a ``.npy`` file next to the csv file. The
+    name of the file includes the registry hash of the csv file, so an updated
+    csv file is never read from an outdated cache. The cache is memory-mapped
+    (copy-on-write) so nothing is parsed or copied when loading it. If
+    *derived*, the table includes the derived profiles and is cached in
+    a separate file.
+    """
+    digest = REGISTRY.registry[os.path.basename(fname)].split(":")[-1]
+    cache = "{}.{}{}.npy".format(
+        os.path.splitext(fname)[0], digest[:16], ".derived" if derived else ""
+    )
+    if not os.path.exists(cache):
+        if derived:
+            table = load_table(fname)
+            data = np.column_stack([table, derived_profiles(table)])
+        else:
+            data = np.loadtxt(fname, delimiter=",")
+        with atomic_output(cache) as tmp:
+            with open(tmp, "wb") as output:
+                np.save(output, data)
+    return np.load(cache, mmap_mode="c")
+
+
+def derived_profiles(table):
+    """
+    Calculate the mass, gravity, pressure and elastic moduli profiles.
+
+    *table* has the columns in :data:`COLUMNS`, with radius sorted in either
+    direction. Returns an array with the columns in :data:`DERIVED_COLUMNS`
+    (SI units, except for pressure and moduli in GPa) in the same order as the
+    rows of *table*. The integrals are cumulative trapezoidal sums over
+    increasing radius. Duplicated radii at discontinuities give intervals of
+    zero length, so the integrals never cross a discontinuity.
+    """
+    descending = table[0, 0] > table[-1, 0]
+    if descending:
+        table = table[::-1]
+    radius = 1e3 * table[:, 0]
+    density = 1e3 * table[:, 2]
+    vp2 = 1e6 * (table[:, 3] ** 2 + 4 * table[:, 4] ** 2) / 5
+    vs2 = 1e6 * (2 * table[:, 5] ** 2 + table[:, 6] ** 2) / 3
+    mass = cumulative_trapezoid(4 * np.pi * radius**2 * density, radius)
+    gravity = np.zeros_like(mass)
+    nonzero = radius > 0
+    gravity[nonzero] = GRAVITATIONAL_CONSTANT * mass[nonzero] / radius[nonzero] ** 2
+    weight = cumulative_trapezoid(density * gravity, radius)
+    pressure = weight[-1] - weight
+    shear_modulus = density * vs2
+    bulk_modulus = density * vp2 - 4 / 3 * shear_modulus
+    profiles = np.column_stack(
+        [mass, gravity, 1e-9 * pressure, 1e-9 * bulk_modulus, 1e-9 * shear_modulus]
+    )
+    if descending:
+        profiles = profiles[::-1]
+    return profiles
+
+
+def cumulative_trapezoid(values, coordinate):
+    "Cumulative integral with the trapezoidal rule, starting from zero"
+    areas = 0.5 * (values[1:] + values[:-1]) * np.diff(coordinate)
+    return np.concatenate([[0], np.cumsum(areas)])
+
+
+def prem_at(radius=None, depth=None):
+    """
+    Evaluate the Preliminary Reference Earth Model (PREM) at any radius.
+
+    Interpolates linearly between the samples of the model returned by
+    :func:`fetch_prem` without crossing the discontinuities between layers.
+    Points exactly on a discontinuity get the values at the top of the layer
+    below it. All points are evaluated at once with vectorized operations, so
+    millions of points take a fraction of a second.
+
+    Parameters
+    ----------
+    radius : None, float or array
+        The radius of the points in km. Can't be used with *depth*.
+    depth : None, float or array
+        The depth of the points in km (below the surface at 6371 km). Can't be
+        used with *radius*.
+
+    Returns
+    -------
+    prem : :class:`pandas.DataFrame`
+        The model at each point (flattened), with the same columns as
+        :func:`fetch_prem`. Points outside of the Earth are assigned NaN.
+
+    """
+    if (radius is None) == (depth is None):
+        raise ValueError("Must give either the radius or the depth of the points.")
+    table = fetch_prem().to_numpy()
+    # Sort the samples by increasing radius. Samples at the same radius
+    # (discontinuities) are ordered from the bottom layer to the top layer.
+    if table[0, 0] > table[-1, 0]:
+        table = table[::-1]
+    radii = table[:, 0]
+    surface = radii[-1]
+    if radius is None:
+        depth = np.asarray(depth, dtype="float64").ravel()
+        radius = surface - depth
+    else:
+        radius = np.asarray(radius, dtype="float64").ravel()
+        depth = surface - radius
+    # The points are between samples i and i + 1 such that
+    # radii[i] < radius <= radii[i + 1], which is never a discontinuity
+    index = np.clip(np.searchsorted(radii, radius, side="left") - 1, 0, radii.size - 2)
+    weight = (radius - radii[index]) / (radii[index + 1] - radii[index])
+    outside = (radius < radii[0]) | (radius > surface)
+    values = {"radius": radius, "depth": depth}
+    for i, column in enumerate(COLUMNS[2:], start=2):
+        value = table[index, i] + weight * (table[index + 1, i] - table[index, i])
+        value[outside] = np.nan
+        values[column] = value
+    return pd.DataFrame(values, columns=COLUMNS, copy=False)
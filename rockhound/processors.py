@@ -0,0 +1,297 @@
+"""
+Pooch processors for post-processing the downloaded files.
+"""
+import bz2
+import mmap
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from zipfile import ZipFile
+
+from .atomic import atomic_output
+
+# Bit patterns (48 bits) at the start of each compressed block of a bzip2
+# stream and at the end of the stream
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_END_MAGIC = 0x177245385090
+
+# Process pools shared by all decompressions, by number of workers
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class UnzipMembers:  # pylint: disable=too-few-public-methods
+    """
+    Pooch processor that extracts only some files from a zip archive.
+
+    Unlike :class:`pooch.Unzip`, only the requested members are extracted and
+    members that were already extracted are reused, so the archive can be
+    extracted gradually as different files are needed. Files are extracted to
+    the same folder as :class:`pooch.Unzip` (the archive name followed by
+    ``.unzip``) so files extracted by one can be used by the other.
+
+    Parameters
+    ----------
+    members : list of str
+        The base names of the files that will be extracted. Folders inside the
+        archive don't need to be included.
+
+    """
+
+    def __init__(self, members):
+        self.members = list(members)
+
+    def __call__(self, fname, action, pooch):
+        """
+        Extract the members from the archive if needed.
+
+        Parameters
+        ----------
+        fname : str
+            Full path of the zipped file in local storage.
+        action : str
+            Indicates what action was taken by :meth:`pooch.Pooch.fetch`. If
+            the file was downloaded or updated, the members extracted from the
+            old archive are deleted and the requested ones are extracted
+            again.
+        pooch : :class:`pooch.Pooch`
+            The instance of :class:`pooch.Pooch` that is calling this.
+
+        Returns
+        -------
+        fnames : list of str
+            The full paths of the extracted members, in the same order as
+            *members*.
+
+        """
+        extract_dir = fname + ".unzip"
+        if action in ("update", "download"):
+            shutil.rmtree(extract_dir, ignore_errors=True)
+        with ZipFile(fname, "r") as archive:
+            names = {
+                os.path.basename(name): name
+                for name in archive.namelist()
+                if not name.endswith("/")
+            }
+            missing = set(self.members).difference(names)
+            if missing:
+                raise ValueError(
+                    "Files {} not found in archive '{}'.".format(sorted(missing), fname)
+                )
+            paths = []
+            for member in self.members:
+                path = os.path.join(extract_dir, names[member])
+                if not os.path.exists(path):
+                    extract_member(archive, names[member], path)
+                paths.append(path)
+        return paths
+
+
+def extract_member(archive, name, path):
+    """
+    Extract a single member of a zip archive to the given path.
+
+    The member is extracted to a uniquely named temporary file first (see
+    :func:`~rockhound.atomic.atomic_output`).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_output(path) as tmp, open(tmp, "wb") as output:
+        with archive.open(name) as source:
+            shutil.copyfileobj(source, output)
+
+
+class ParallelDecompress:  # pylint: disable=too-few-public-methods
+    """
+    Pooch processor that decompresses bzip2 files in parallel.
+
+    bzip2 files are made of independently compressed blocks (of up to 900 kB
+    of uncompressed data). The blocks are located by searching the file for
+    the bit pattern that starts each block and are decompressed in a pool of
+    processes. Blocks aren't aligned with bytes, so each one is shifted and
+    wrapped into a valid single-block bzip2 stream before decompressing,
+    which also checks the CRC of the block. If any block fails (for example,
+    if the bit pattern appeared by chance inside the compressed data) or the
+    pool breaks, the whole file is decompressed serially instead.
+
+    The file is memory mapped while searching for the blocks instead of read
+    into memory. The processes are started with the ``"spawn"`` method (so
+    they are safe to start from threads) and the pool is shared by all files
+    decompressed with the same number of *workers*, so files decompressed
+    concurrently don't start more processes.
+
+    The decompressed file has the same name as the one created by
+    :class:`pooch.Decompress` (the file name followed by ``.decomp``) so files
+    decompressed by one can be used by the other.
+
+    Parameters
+    ----------
+    workers : None or int
+        Number of processes used to decompress the blocks. If None, will use
+        the number of CPUs of the machine.
+
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+
+    def __call__(self, fname, action, pooch):
+        """
+        Decompress the file if needed.
+
+        Parameters
+        ----------
+        fname : str
+            Full path of the compressed file in local storage.
+        action : str
+            Indicates what action was taken by :meth:`pooch.Pooch.fetch`. If
+            the file was downloaded or updated, it's decompressed again.
+        pooch : :class:`pooch.Pooch`
+            The instance of :class:`pooch.Pooch` that is calling this.
+
+        Returns
+        -------
+        fname : str
+            The full path of the decompressed file.
+
+        """
+        output = fname + ".decomp"
+        if action in ("update", "download") or not os.path.exists(output):
+            decompress_bz2(fname, output, self.workers)
+        return output
+
+
+def decompress_bz2(fname, output, workers):
+    """
+    Decompress a bzip2 file block by block using a pool of processes.
+
+    The decompressed data is written to a uniquely named temporary file first
+    (see :func:`~rockhound.atomic.atomic_output`).
+    """
+    blocks = find_file_blocks(fname)
+    with atomic_output(output) as tmp, open(tmp, "wb") as destination:
+        try:
+            if workers > 1 and len(blocks) > 1:
+                parts = get_pool(workers).map(
+                    decompress_block, repeat(fname), *zip(*blocks)
+                )
+                for part in parts:
+                    destination.write(part)
+            else:
+                for start, end in blocks:
+                    destination.write(decompress_block(fname, start, end))
+            if not blocks:
+                raise ValueError("No bzip2 blocks found in '{}'.".format(fname))
+        except (OSError, ValueError, EOFError, BrokenProcessPool) as error:
+            if isinstance(error, BrokenProcessPool):
+                discard_pool(workers)
+            destination.seek(0)
+            destination.truncate()
+            with bz2.open(fname, "rb") as source:
+                shutil.copyfileobj(source, destination)
+
+
+def get_pool(workers):
+    """
+    Get the shared process pool with the given number of workers.
+
+    The pool is created the first time it's needed. Its processes are started
+    with the ``"spawn"`` method because forking a process that runs other
+    threads can deadlock.
+    """
+    with POOLS_LOCK:
+        if workers not in POOLS:
+            POOLS[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return POOLS[workers]
+
+
+def discard_pool(workers):
+    "Shut down a broken shared process pool so that a new one is created"
+    with POOLS_LOCK:
+        pool = POOLS.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def find_file_blocks(fname):
+    """
+    Find the compressed blocks of a bzip2 file without reading it into memory.
+
+    The file is memory mapped and searched with :func:`find_blocks`.
+    """
+    if os.path.getsize(fname) == 0:
+        return []
+    with open(fname, "rb") as source:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return find_blocks(data)
+
+
+def find_blocks(data):
+    """
+    Find the start and end (in bits) of the compressed blocks of bzip2 data.
+
+    *data* can be :class:`bytes` or a memory mapped file. Each block ends where
+    the next block or the end of the stream starts. Works with files that have
+    several concatenated streams.
+    """
+    starts = find_bits(data, BZ2_BLOCK_MAGIC)
+    boundaries = sorted(starts + find_bits(data, BZ2_END_MAGIC))
+    ends = dict(zip(boundaries[:-1], boundaries[1:]))
+    return [(start, ends[start]) for start in starts if start in ends]
+
+
+def find_bits(data, pattern):
+    """
+    Find the positions (in bits) of a 48-bit pattern in bytes-like data.
+
+    The pattern can start at any bit of a byte. For each of the 8 possible
+    offsets, the bytes fully covered by the shifted pattern are searched with
+    :meth:`bytes.find` and matches are checked for the partial bytes.
+    """
+    positions = []
+    mask = (1 << 48) - 1
+    for offset in range(8):
+        shifted = (pattern << (8 - offset)).to_bytes(7, "big")
+        first = 0 if offset == 0 else 1
+        key = shifted[first:6]
+        index = data.find(key)
+        while index != -1:
+            start = index - first
+            if start >= 0:
+                window = int.from_bytes(data[start : start + 7].ljust(7, b"\0"), "big")
+                if (window >> (8 - offset)) & mask == pattern:
+                    positions.append(8 * start + offset)
+            index = data.find(key, index + 1)
+    return sorted(positions)
+
+
+def decompress_block(fname, start, end):
+    """
+    Decompress a single bzip2 block given its start and end in bits.
+
+    The bits of the block are read from the file and turned into a bzip2
+    stream with a header, the block, and an end of stream marker with the CRC
+    of the block (the CRC of a single block stream is the same as the block).
+    """
+    with open(fname, "rb") as source:
+        source.seek(start // 8)
+        chunk = source.read((end + 7) // 8 - start // 8)
+    size = end - start
+    block = int.from_bytes(chunk, "big")
+    # Remove the bits that come after the end and before the start
+    block >>= 8 * len(chunk) - (end - 8 * (start // 8))
+    block &= (1 << size) - 1
+    # The CRC comes right after the 48 bits of the block magic
+    crc = (block >> (size - 80)) & 0xFFFFFFFF
+    stream = (((block << 48) | BZ2_END_MAGIC) << 32) | crc
+    size += 80
+    padding = -size % 8
+    stream <<= padding
+    return bz2.decompress(b"BZh9" + stream.to_bytes((size + padding) // 8, "big"))
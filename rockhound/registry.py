@@ -2,14 +2,146 @@
 Create a dataset registry using Pooch and the rockhound/registry.txt file.
 """
 import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import pooch
+from .atomic import atomic_output
 
+# Maximum number of threads used to download files concurrently
+MAX_WORKERS = 8
 
-REGISTRY = pooch.create(
-    path=pooch.os_cache("rockhound"), base_url="", env="ROCKHOUND_DATA_DIR"
-)
-REGISTRY.load_registry(os.path.join(os.path.dirname(__file__), "registry.txt"))
+# File with the names, hashes and URLs of all files in the registry
+REGISTRY_FILE = os.path.join(os.path.dirname(__file__), "registry.txt")
+
+
+class LazyRegistry:  # pylint: disable=too-few-public-methods
+    """
+    Stand-in for the :class:`pooch.Pooch` registry that creates it when used.
+
+    Accessing any attribute (like :meth:`pooch.Pooch.fetch` or
+    ``abspath``) imports Pooch, creates the registry and loads the registry
+    file. Nothing is done until then, so importing the package and starting
+    workers that never fetch any data doesn't pay for it.
+
+    If the ``ROCKHOUND_REGISTRY_CACHE`` environment variable is set to a file
+    path, the parsed registry file is saved there (in JSON format) and loaded
+    from it the next time, as long as the contents of the registry file
+    haven't changed.
+
+    Files with HTTP or HTTPS URLs are downloaded by default with
+    :class:`rockhound.download.ResumableDownloader` in a single stream (no
+    HEAD request is made). It keeps the connections to each host open and
+    reuses them for the next files instead of connecting again for every file.
+    Pass ``downloader=ResumableDownloader()`` to download large files in
+    several segments at the same time.
+
+    Parameters
+    ----------
+    fname : str
+        The registry file with the names, hashes and URLs of the files.
+
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.pooch = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name in ("fname", "pooch", "lock"):
+            # Avoid infinite recursion if the instance isn't initialized yet
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def get(self):
+        "Return the :class:`pooch.Pooch` registry, creating it if needed"
+        if self.pooch is None:
+            with self.lock:
+                if self.pooch is None:
+                    self.pooch = create_registry(
+                        self.fname, cache=os.environ.get("ROCKHOUND_REGISTRY_CACHE")
+                    )
+        return self.pooch
+
+    def fetch(self, fname, processor=None, downloader=None, progressbar=False):
+        """
+        Fetch a file from the registry with :meth:`pooch.Pooch.fetch`.
+
+        If no *downloader* is given (and no progress bar is requested), files
+        with HTTP or HTTPS URLs are downloaded in a single stream over pooled
+        keep-alive connections, resuming interrupted downloads.
+        """
+        registry = self.get()
+        if downloader is None and not progressbar:
+            if registry.get_url(fname).startswith(("http://", "https://")):
+                # Imported here because it imports requests, which is slow
+                from .download import (  # pylint: disable=import-outside-toplevel
+                    ResumableDownloader,
+                )
+
+                downloader = ResumableDownloader(segments=1, fname=fname)
+        return registry.fetch(
+            fname, processor=processor, downloader=downloader, progressbar=progressbar
+        )
+
+
+def create_registry(fname, cache=None):
+    """
+    Create the :class:`pooch.Pooch` registry and load the registry file.
+
+    If *cache* is a file path, the parsed registry is read from it if it's up
+    to date or saved to it otherwise. The cache is a JSON file that stores the
+    SHA256 hash of the registry file contents, so any change to the registry
+    file invalidates it. Caches that can't be read are ignored and replaced.
+    """
+    import pooch  # pylint: disable=import-outside-toplevel
+
+    registry = pooch.create(
+        path=pooch.os_cache("rockhound"), base_url="", env="ROCKHOUND_DATA_DIR"
+    )
+    with open(fname, "rb") as source:
+        version = hashlib.sha256(source.read()).hexdigest()
+    if cache is not None:
+        parsed = read_registry_cache(cache)
+        if parsed is not None and parsed["version"] == version:
+            registry.registry.update(parsed["registry"])
+            registry.urls.update(parsed["urls"])
+            return registry
+    registry.load_registry(fname)
+    if cache is not None:
+        parsed = dict(version=version, registry=registry.registry, urls=registry.urls)
+        with atomic_output(cache) as tmp:
+            with open(tmp, "w") as output:
+                json.dump(parsed, output)
+    return registry
+
+
+def read_registry_cache(cache):
+    """
+    Read the parsed registry from a JSON cache file.
+
+    Returns None if the file doesn't exist or doesn't have the version and
+    the mappings of file names to hashes and URLs (all strings).
+    """
+    try:
+        with open(cache) as cached:
+            parsed = json.load(cached)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("version"), str):
+        return None
+    for key in ("registry", "urls"):
+        mapping = parsed.get(key)
+        if not isinstance(mapping, dict) or not all(
+            isinstance(value, str) for value in mapping.values()
+        ):
+            return None
+    return parsed
+
+
+REGISTRY = LazyRegistry(REGISTRY_FILE)
 
 
 def data_location():
@@ -30,3 +162,75 @@ def data_location():
 
     """
     return str(REGISTRY.abspath)
+
+
+class FetchError(RuntimeError):
+    """
+    Raised when one or more files could not be fetched from the registry.
+
+    The ``errors`` attribute is a dictionary mapping the name of each file that
+    failed to the exception raised while fetching it.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        lines = [
+            "{}: {}: {}".format(fname, type(error).__name__, error)
+            for fname, error in errors.items()
+        ]
+        super().__init__(
+            "Failed to fetch {} file(s):\n{}".format(len(errors), "\n".join(lines))
+        )
+
+
+def fetch_files(fnames, *, processor=None, workers=None):
+    """
+    Fetch several files from the registry concurrently.
+
+    Each file is fetched with :meth:`pooch.Pooch.fetch` in a bounded pool of
+    threads, so downloading files that aren't in the data directory yet takes
+    about as long as the slowest of them instead of the sum of all.
+
+    Parameters
+    ----------
+    fnames : list of str
+        Names of the files in the registry.
+    processor : None or callable
+        A Pooch processor that will be applied to every file.
+    workers : None or int
+        Maximum number of files that will be fetched at the same time. If None,
+        will use one thread per file up to :data:`MAX_WORKERS`.
+
+    Returns
+    -------
+    paths : list of str
+        The local paths of the files (or the output of the processor) in the
+        same order as *fnames*.
+
+    Raises
+    ------
+    FetchError
+        If any of the files failed to download or process. All other files are
+        fetched regardless and the error lists every file that failed.
+
+    """
+    fnames = list(fnames)
+    if workers is None:
+        workers = min(len(fnames), MAX_WORKERS)
+    if workers < 1:
+        raise ValueError("Invalid number of workers '{}'.".format(workers))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(REGISTRY.fetch, fname, processor=processor)
+            for fname in fnames
+        ]
+    paths, errors = [], {}
+    for fname, future in zip(fnames, futures):
+        error = future.exception()
+        if error is not None:
+            errors[fname] = error
+        else:
+            paths.append(future.result())
+    if errors:
+        raise FetchError(errors)
+    return paths
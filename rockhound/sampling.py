@@ -0,0 +1,174 @@
+"""
+Sample regular global grids at scattered points.
+"""
+import numpy as np
+import xarray as xr
+
+# Size of the square blocks of grid points that are read at a time from grids
+# that aren't Dask arrays (256 x 256 points is 256 kb of 32-bit values)
+BLOCK_SIZE = 256
+
+
+def sample(grid, longitude, latitude, *, method="nearest"):
+    """
+    Sample a regular grid at the given points.
+
+    Calculates the grid indices of each point directly from the grid spacing,
+    without searching the coordinates or creating intermediate grids. Lazily
+    loaded grids are read in blocks of :data:`BLOCK_SIZE` x :data:`BLOCK_SIZE`
+    grid points and only the blocks that contain points are read (only the
+    chunks containing points are read from Dask arrays). This makes
+    it possible to sample millions of points (like ship tracks or station
+    locations) from grids like the ones returned by :func:`fetch_etopo1` and
+    :func:`fetch_seafloor_age` with little memory.
+
+    Longitudes are wrapped around if the grid is global, so points can be in
+    a different longitude convention than the grid. Points outside of the grid
+    are assigned NaN.
+
+    Parameters
+    ----------
+    grid : :class:`xarray.DataArray` or :class:`xarray.Dataset`
+        A grid with regularly spaced ``longitude`` and ``latitude``
+        dimensions.
+    longitude : float or array
+        Longitude of the points in degrees.
+    latitude : float or array
+        Latitude of the points in degrees. Must have the same shape as
+        *longitude*.
+    method : str
+        The interpolation method. Can be ``"nearest"`` for the value of the
+        nearest grid point or ``"bilinear"`` for bilinear interpolation between
+        the 4 surrounding grid points.
+
+    Returns
+    -------
+    values : array or dict
+        1D array with the values of the grid at each point (flattened). If
+        *grid* is a :class:`xarray.Dataset`, will be a dictionary with the
+        values of each data variable that has ``longitude`` and ``latitude``
+        dimensions.
+
+    """
+    methods = ["nearest", "bilinear"]
+    if method not in methods:
+        raise ValueError(
+            "Invalid sampling method '{}'. Must be one of {}.".format(method, methods)
+        )
+    longitude, latitude = np.broadcast_arrays(
+        np.asarray(longitude, dtype="float64").ravel(),
+        np.asarray(latitude, dtype="float64").ravel(),
+    )
+    grid_longitude = grid.longitude.values
+    periodic = is_global(grid_longitude)
+    if periodic:
+        longitude = grid_longitude[0] + (longitude - grid_longitude[0]) % 360
+    columns = grid_indices(grid_longitude, longitude, method, periodic=periodic)
+    rows = grid_indices(grid.latitude.values, latitude, method)
+    if isinstance(grid, xr.Dataset):
+        return {
+            name: interpolate(grid[name], rows, columns)
+            for name in grid.data_vars
+            if {"longitude", "latitude"}.issubset(grid[name].dims)
+        }
+    return interpolate(grid, rows, columns)
+
+
+def is_global(coordinate):
+    """
+    Check if a longitude coordinate covers the whole globe.
+    """
+    spacing = abs(coordinate[1] - coordinate[0])
+    return coordinate[-1] - coordinate[0] + spacing >= 360 - 1e-3 * spacing
+
+
+def grid_indices(coordinate, points, method, periodic=False):
+    """
+    Calculate the indices of the grid points used to interpolate each point.
+
+    Returns a tuple with: the indices (the nearest point or the first point of
+    the interval containing the point), the indices of the next points, the
+    interpolation weights of the next points, and a boolean array which is
+    False for points outside of the grid. If *periodic*, the point after the
+    last one is the first one. Next indices and weights are None for nearest
+    neighbors.
+    """
+    size = coordinate.size
+    spacing = (coordinate[-1] - coordinate[0]) / (size - 1)
+    if not np.allclose(np.diff(coordinate), spacing):
+        raise ValueError("Grid coordinates must be regularly spaced.")
+    position = (points - coordinate[0]) / spacing
+    tolerance = 1e-6
+    if periodic:
+        valid = np.ones(position.size, dtype="bool")
+    else:
+        valid = (position >= -tolerance) & (position <= size - 1 + tolerance)
+        position = np.clip(position, 0, size - 1)
+    if method == "nearest":
+        indices = np.rint(position).astype("int64") % size
+        indices[~valid] = 0
+        return indices, None, None, valid
+    indices = np.floor(position).astype("int64")
+    if not periodic:
+        indices = np.clip(indices, 0, max(size - 2, 0))
+    weights = position - indices
+    indices %= size
+    indices[~valid] = 0
+    return indices, (indices + 1) % size, weights, valid
+
+
+def interpolate(array, rows, columns):
+    """
+    Interpolate a grid at the points given by their row and column indices.
+
+    *rows* and *columns* are the outputs of :func:`grid_indices`.
+    """
+    array = array.transpose("latitude", "longitude")
+    row, next_row, row_weights, row_valid = rows
+    column, next_column, column_weights, column_valid = columns
+    if row_weights is None:
+        values = gather(array, row, column)
+    else:
+        # Get all 4 corners in one go to read the grid only once
+        corners = gather(
+            array,
+            np.concatenate([row, row, next_row, next_row]),
+            np.concatenate([column, next_column, column, next_column]),
+        ).reshape(4, row.size)
+        values = (1 - row_weights) * (
+            (1 - column_weights) * corners[0] + column_weights * corners[1]
+        ) + row_weights * (
+            (1 - column_weights) * corners[2] + column_weights * corners[3]
+        )
+    values = values.astype(np.result_type(values.dtype, np.float32))
+    values[~(row_valid & column_valid)] = np.nan
+    return values
+
+
+def gather(array, rows, columns):
+    """
+    Get the values of a grid at the given row and column indices.
+
+    Uses point-wise indexing on Dask arrays (reads only the chunks that contain
+    points). Other grids are split into square blocks of :data:`BLOCK_SIZE`
+    points and only the part of each block that contains points is read, so
+    points spread around the globe don't load the whole grid at once.
+    """
+    if array.chunks is not None:
+        return np.asarray(array.data.vindex[rows, columns].compute())
+    values = np.empty(rows.size, dtype=array.dtype)
+    if rows.size == 0:
+        return values
+    blocks = (rows // BLOCK_SIZE) * (array.shape[1] // BLOCK_SIZE + 1)
+    blocks += columns // BLOCK_SIZE
+    order = np.argsort(blocks, kind="stable")
+    starts = np.flatnonzero(np.diff(blocks[order])) + 1
+    for indices in np.split(order, starts):
+        block_rows, block_columns = rows[indices], columns[indices]
+        row_min, column_min = block_rows.min(), block_columns.min()
+        window = array.isel(
+            latitude=slice(row_min, block_rows.max() + 1),
+            longitude=slice(column_min, block_columns.max() + 1),
+        ).values
+        values[indices] = window[block_rows - row_min, block_columns - column_min]
+    return values
@@ -2,13 +2,26 @@
 Load the seafloor age, spreading rate, and spreading symmetry grids by
 Müller et al. (2008).
 """
+import numpy as np
 import xarray as xr
-from pooch import Decompress
 
-from .registry import REGISTRY
+from .cache import cached
+from .processors import ParallelDecompress
+from .registry import fetch_files
+from .utils import subset_region, file_chunks
 
 
-def fetch_seafloor_age(*, resolution="6min", load=True, **kwargs):
+@cached
+def fetch_seafloor_age(
+    *,
+    resolution="6min",
+    load=True,
+    region=None,
+    dtype="float32",
+    lazy=False,
+    chunks=None,
+    **kwargs
+):
     """
     Fetch the age of the oceanic lithosphere global grid
 
@@ -30,6 +43,35 @@ def fetch_seafloor_age(*, resolution="6min", load=True, **kwargs):
         Whether to load the data into an :class:`xarray.Dataset` or just return
         the path to the downloaded data. If False, will return a list with the
         paths to the age and age uncertainty grids, respectively.
+    region : None or tuple
+        Only load the part of the grids inside the region ``(west, east, south,
+        north)`` (in degrees). Only the rows and columns inside the region are
+        read from the files. Longitudes of the region can be in [-180, 180] or
+        [0, 360] and the region can cross the antimeridian (``west > east``).
+        If None, will load the whole grids.
+    dtype : str or numpy dtype
+        The floating point data type of the grids. The files store the ages
+        multiplied by 100 as integers, so the grids must be converted to
+        floating point to get the ages in millions of years. The default 32-bit
+        floats use half the memory of 64-bit floats.
+    lazy : bool
+        If True, the division by 100 is not done when loading. Instead, it's
+        recorded in the ``scale_factor`` attribute of the grids following the
+        CF conventions and applied by xarray only when the values are accessed.
+        The files are only read when needed (or only the chunks that are
+        needed if using Dask arrays). Offsets in the ``add_offset`` attribute
+        of the files (if any) are divided by 100 as well. xarray decodes
+        integers with an offset into 64-bit floats, so these grids ignore
+        *dtype* unless they are Dask arrays.
+    chunks : None, str, int, tuple or dict
+        Load the grids as
+        `Dask arrays <https://docs.dask.org/en/latest/array.html>`__ with
+        these chunk sizes. Dictionaries can use the dimension names
+        ``longitude`` and ``latitude``. If ``"auto"``, chunks will be whole
+        rows of the grids (matching the layout of the files) with a number of
+        rows chosen by Dask. The grids are then only read when needed, one
+        chunk at a time, and all processing done by this function is delayed.
+        If None, will not use Dask.
     kwargs
         Keyword arguments will be forwarded to the :func:`xarray.open_dataset`
         function that loads the grid into memory.
@@ -47,22 +89,45 @@ def fetch_seafloor_age(*, resolution="6min", load=True, **kwargs):
                 resolution, resolutions
             )
         )
-    fname_age = REGISTRY.fetch(
-        "age.3.{}.nc.bz2".format(resolution[0]), processor=Decompress()
-    )
-    fname_error = REGISTRY.fetch(
-        "ageerror.3.{}.nc.bz2".format(resolution[0]), processor=Decompress()
+    # Both files are decompressed at the same time, each in parallel
+    fname_age, fname_error = fetch_files(
+        [
+            "age.3.{}.nc.bz2".format(resolution[0]),
+            "ageerror.3.{}.nc.bz2".format(resolution[0]),
+        ],
+        processor=ParallelDecompress(),
     )
     if not load:
         return [fname_age, fname_error]
-    grid = xr.merge(
-        [
-            xr.open_dataset(fname_age, **kwargs).rename(z="age") / 100,
-            xr.open_dataset(fname_error, **kwargs).rename(z="uncertainty") / 100,
-        ]
-    )
-    # Add more metadata and fix some names
-    grid = grid.rename(x="longitude", y="latitude")
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError(
+            "Invalid seafloor age grid dtype '{}'. Must be a floating point type.".format(
+                dtype
+            )
+        )
+    grids = []
+    for fname, name in [(fname_age, "age"), (fname_error, "uncertainty")]:
+        grid = xr.open_dataset(
+            fname, mask_and_scale=False, chunks=file_chunks(chunks), **kwargs
+        ).rename(z=name, x="longitude", y="latitude")
+        if region is not None:
+            # Cut the region before scaling so that only it is read from disk
+            grid = subset_region(grid, region)
+        if lazy or chunks is not None:
+            factors = scaling(grid[name].attrs, dtype)
+            if "add_offset" not in grid[name].attrs:
+                del factors["add_offset"]
+            grid[name].attrs.update(factors)
+            grid = xr.decode_cf(grid)
+            if grid[name].chunks is not None and grid[name].dtype != dtype:
+                # xarray decodes integers with an offset into 64-bit floats
+                grid[name] = grid[name].astype(dtype)
+        else:
+            grid[name] = decode(grid[name], dtype)
+        grids.append(grid)
+    grid = xr.merge(grids)
+    # Add more metadata
     grid.attrs["title"] = "Age of oceanic lithosphere"
     grid.attrs["doi"] = "10.1029/2007GC001743"
     grid.age.attrs["long_name"] = "Age of oceanic lithosphere"
@@ -70,3 +135,43 @@ def fetch_seafloor_age(*, resolution="6min", load=True, **kwargs):
     grid.uncertainty.attrs["long_name"] = "Age uncertainty"
     grid.uncertainty.attrs["units"] = "million_years"
     return grid
+
+
+def decode(grid, dtype):
+    """
+    Mask the fill values of a grid of integer ages and scale it into *dtype*.
+
+    The integers are converted to *dtype* once and the conversion result is
+    masked and scaled in place. Decoding with xarray (or dividing the masked
+    grid) would create a 64-bit floating point copy of the whole grid first.
+    """
+    attrs = dict(grid.attrs)
+    factors = scaling(attrs, dtype)
+    fill_value = attrs.pop("_FillValue", attrs.pop("missing_value", None))
+    attrs.pop("scale_factor", None)
+    attrs.pop("add_offset", None)
+    raw = grid.values
+    values = raw.astype(dtype)
+    if fill_value is not None:
+        values[raw == fill_value] = np.nan
+    values *= factors["scale_factor"]
+    if factors["add_offset"]:
+        values += factors["add_offset"]
+    return xr.DataArray(
+        values, coords=grid.coords, dims=grid.dims, name=grid.name, attrs=attrs
+    )
+
+
+def scaling(attrs, dtype):
+    """
+    Get the scale factor and offset that convert the stored integers to ages.
+
+    The grids store the ages (in millions of years) multiplied by 100, so the
+    scale factor and offset in the attributes (if any) are multiplied by 0.01.
+    Returns a dictionary with the ``scale_factor`` and ``add_offset`` in
+    *dtype*.
+    """
+    return {
+        "scale_factor": dtype.type(0.01 * attrs.get("scale_factor", 1)),
+        "add_offset": dtype.type(0.01 * attrs.get("add_offset", 0)),
+    }
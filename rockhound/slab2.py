@@ -3,7 +3,9 @@ Load the subduction geometry for a given zone.
 """
 import xarray as xr
 
-from .registry import REGISTRY
+from .cache import cached
+from .registry import fetch_files
+from .utils import file_chunks
 
 DATASETS = {
     "depth": dict(name="Slab depth", units="meters"),
@@ -44,7 +46,8 @@ ZONES = {
 }
 
 
-def fetch_slab2(zone, *, load=True):
+@cached
+def fetch_slab2(zone, *, load=True, workers=None, chunks=None, **kwargs):
     """
     Load the Slab2 model for a given subduction zone.
 
@@ -94,9 +97,21 @@ def fetch_slab2(zone, *, load=True):
         Whether to load the data into an :class:`xarray.Dataset` or just return
         the path to the downloaded data. If False, will return a list with the
         paths to the subduction grids, respectively.
+    workers : None or int
+        Maximum number of grid files downloaded at the same time. If None, all
+        five grids are downloaded concurrently.
+    chunks : None, str, int, tuple or dict
+        Load the grids as
+        `Dask arrays <https://docs.dask.org/en/latest/array.html>`__ with
+        these chunk sizes. Dictionaries can use the dimension names
+        ``longitude`` and ``latitude``. If ``"auto"``, chunks will be whole
+        rows of the grids (matching the layout of the files) with a number of
+        rows chosen by Dask. The grids are then only read when needed, one
+        chunk at a time, and all processing done by this function is delayed.
+        If None, will not use Dask.
     kwargs
-        Keyword arguments will be forwarded to the :func:`xarray.open_dataset`
-        function that loads the grid into memory.
+        Keyword arguments will be forwarded to the
+        :func:`xarray.open_dataarray` function that loads each grid.
 
     Returns
     -------
@@ -105,15 +120,21 @@ def fetch_slab2(zone, *, load=True):
     """
     if zone not in ZONES:
         raise ValueError("Invalid slab zone: {}".format(zone))
-    fnames = [
-        REGISTRY.fetch(
+    fnames = fetch_files(
+        [
             "{}_slab2_{}.grd".format(ZONES[zone]["fname_indicator"], dataset)
-        )
-        for dataset in DATASETS
-    ]
+            for dataset in DATASETS
+        ],
+        workers=workers,
+    )
     if not load:
         return fnames
-    arrays = [xr.open_dataarray(f).rename(x="longitude", y="latitude") for f in fnames]
+    arrays = [
+        xr.open_dataarray(f, chunks=file_chunks(chunks), **kwargs).rename(
+            x="longitude", y="latitude"
+        )
+        for f in fnames
+    ]
     for array, dataset in zip(arrays, DATASETS):
         array.name = dataset
         # Change long_name and add units of each array
@@ -0,0 +1,75 @@
+"""
+Test the asynchronous data fetching functions.
+"""
+import os
+import time
+import asyncio
+import inspect
+
+import pytest
+
+import rockhound.registry
+from .. import afetch_slab2, aio, PUBLIC_API
+from ..slab2 import DATASETS
+from .utils import serve_directory, make_registry, write_files
+
+
+def test_afetch_slab2_gather(tmp_path, monkeypatch):
+    "Fetch two zones concurrently while the event loop keeps running"
+    fnames = [
+        "{}_slab2_{}.grd".format(indicator, dataset)
+        for indicator in ["alu", "sam"]
+        for dataset in DATASETS
+    ]
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, fnames)
+    latency = 0.5
+    ticks = []
+
+    async def tick():
+        "Record the time of each iteration until cancelled"
+        while True:
+            ticks.append(time.time())
+            await asyncio.sleep(0.05)
+
+    async def fetch():
+        "Fetch both zones while the ticker runs"
+        ticker = asyncio.ensure_future(tick())
+        paths = await asyncio.gather(
+            afetch_slab2("alaska", load=False),
+            afetch_slab2("south_america", load=False),
+        )
+        ticker.cancel()
+        return paths
+
+    with serve_directory(served, latency=latency) as url:
+        registry = make_registry(tmp_path / "cache", url, files)
+        monkeypatch.setattr(rockhound.registry, "REGISTRY", registry)
+        start = time.time()
+        paths = asyncio.run(fetch())
+        elapsed = time.time() - start
+    assert [os.path.basename(path) for path in paths[0] + paths[1]] == fnames
+    # Fetching the zones one after the other would take twice as long
+    assert elapsed < 1.8 * latency
+    # The event loop wasn't blocked while the files were downloading
+    assert len(ticks) >= 5
+    assert max(later - earlier for earlier, later in zip(ticks, ticks[1:])) < latency
+
+
+def test_afetch_slab2_invalid_zone():
+    "Errors should be raised when awaiting"
+    with pytest.raises(ValueError):
+        asyncio.run(afetch_slab2("this is an invalid zone"))
+
+
+def test_async_functions():
+    "Every fetch function should have an asynchronous version"
+    names = [name for name in PUBLIC_API if name.startswith("fetch_")]
+    assert sorted(aio.__all__) == sorted("a" + name for name in names)
+    for name in names:
+        function = getattr(aio, "a" + name)
+        assert inspect.iscoroutinefunction(function)
+        assert function.__name__ == "a" + name
+        assert function.__module__ == "rockhound.aio"
+        assert ":func:`rockhound.{}`".format(name) in function.__doc__
@@ -0,0 +1,53 @@
+"""
+Test writing files through temporary paths.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ..atomic import atomic_output
+
+
+def test_atomic_output_file(tmp_path):
+    "The file should only appear at the end and replace existing files"
+    path = str(tmp_path / "data.txt")
+    with atomic_output(path) as tmp:
+        assert os.path.dirname(tmp) == str(tmp_path)
+        assert not os.path.exists(path)
+        with open(tmp, "w") as output:
+            output.write("first")
+    with atomic_output(path) as tmp:
+        with open(tmp, "w") as output:
+            output.write("second")
+    with open(path) as data:
+        assert data.read() == "second"
+    assert os.listdir(str(tmp_path)) == ["data.txt"]
+
+
+def test_atomic_output_error(tmp_path):
+    "Temporary files and directories should be deleted if writing fails"
+    for directory in [False, True]:
+        with pytest.raises(RuntimeError):
+            with atomic_output(str(tmp_path / "data"), directory=directory) as tmp:
+                assert os.path.isdir(tmp) == directory
+                raise RuntimeError("Interrupted")
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_atomic_output_concurrent(tmp_path):
+    "Concurrent writers shouldn't share temporary paths"
+    path = str(tmp_path / "store")
+
+    def write(index):
+        "Write a directory with a single file"
+        with atomic_output(path, directory=True) as tmp:
+            with open(os.path.join(tmp, "data.txt"), "w") as output:
+                output.write(str(index))
+            return tmp
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        tmps = list(executor.map(write, range(8)))
+    assert len(set(tmps)) == 8
+    assert os.listdir(str(tmp_path)) == ["store"]
+    assert os.listdir(path) == ["data.txt"]
@@ -1,10 +1,18 @@
 """
 Test the Bedmap2 loading function.
 """
+import io
+import os
+from zipfile import ZipFile
+
 import pytest
 import numpy as np
+import numpy.testing as npt
+import xarray as xr
 
-from .. import fetch_bedmap2
+from .. import bedmap2, geotiff, fetch_bedmap2
+from ..bedmap2 import DATASETS, member_name, upsample
+from .utils import serve_registry, file_hash
 
 
 def test_bedmap2_invalid_dataset():
@@ -76,3 +84,236 @@ def test_bedmap2():
     assert tuple(grid.dims) == ("x", "y")
     assert getattr(grid, "thickness_uncertainty_5km").min() == 0.0
     assert getattr(grid, "thickness_uncertainty_5km").max() == 65535.0
+
+
+@pytest.fixture(name="fake_bedmap2")
+def fixture_fake_bedmap2(tmp_path, monkeypatch):
+    """
+    Serve a zip archive with small GeoTIFF grids like the Bedmap2 ones.
+
+    The 1 km grids have 60 x 50 points (32-bit float), the 5 km grid has 12 x
+    10 points (16-bit unsigned integers), and the Lake Vostok mask has 5 x
+    4 points. The value of each grid point is its row index (or 9999 for the
+    last column, which is the no data value).
+    Yields the path to the folder where the archive is extracted.
+    """
+    rasterio = pytest.importorskip("rasterio")
+    content = io.BytesIO()
+    shapes = {"thickness_uncertainty_5km": (12, 10), "lakemask_vostok": (5, 4)}
+    with ZipFile(content, "w") as archive:
+        for dataset in DATASETS:
+            shape = shapes.get(dataset, (60, 50))
+            spacing = 5000 if dataset == "thickness_uncertainty_5km" else 1000
+            dtype = "uint16" if dataset == "thickness_uncertainty_5km" else "float32"
+            data = np.repeat(np.arange(shape[0]), shape[1]).reshape(shape)
+            data[:, -1] = 9999
+            tiff = str(tmp_path / member_name(dataset))
+            with rasterio.open(
+                tiff,
+                "w",
+                driver="GTiff",
+                height=shape[0],
+                width=shape[1],
+                count=1,
+                dtype=dtype,
+                nodata=9999,
+                crs="EPSG:3031",
+                transform=rasterio.transform.from_origin(
+                    -30000, 25000, spacing, spacing
+                ),
+            ) as output:
+                output.write(data.astype(dtype), 1)
+            archive.write(tiff, "bedmap2_tiff/{}".format(member_name(dataset)))
+            os.remove(tiff)
+    files = {"bedmap2_tiff.zip": content.getvalue()}
+    with serve_registry(tmp_path, monkeypatch, bedmap2, files):
+        yield tmp_path / "cache" / "bedmap2_tiff.zip.unzip" / "bedmap2_tiff"
+
+
+def test_bedmap2_extract_only_requested(fake_bedmap2):
+    "Only the requested datasets should be extracted from the archive"
+    names = fetch_bedmap2(["bed", "geoid"], load=False)
+    assert [os.path.basename(name) for name in names] == [
+        "bedmap2_bed.tif",
+        "gl04c_geiod_to_WGS84.tif",
+    ]
+    assert sorted(os.listdir(str(fake_bedmap2))) == [
+        "bedmap2_bed.tif",
+        "gl04c_geiod_to_WGS84.tif",
+    ]
+    names = fetch_bedmap2(["surface", "bed"], load=False)
+    assert [os.path.basename(name) for name in names] == [
+        "bedmap2_surface.tif",
+        "bedmap2_bed.tif",
+    ]
+    assert len(os.listdir(str(fake_bedmap2))) == 3
+
+
+def test_bedmap2_fnames_index(fake_bedmap2, monkeypatch):
+    "Paths to extracted files should be reused without fetching the archive"
+    names = fetch_bedmap2(["bed", "surface"], load=False)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Archive shouldn't be fetched")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(bedmap2.REGISTRY, "fetch", fail)
+        assert fetch_bedmap2(["surface", "bed"], load=False) == names[::-1]
+        with pytest.raises(RuntimeError):
+            fetch_bedmap2(["bed", "geoid"], load=False)
+    # Deleted files are extracted again
+    os.remove(names[0])
+    assert fetch_bedmap2("bed", load=False) == names[:1]
+    assert os.path.exists(names[0])
+    assert sorted(os.listdir(str(fake_bedmap2))) == [
+        "bedmap2_bed.tif",
+        "bedmap2_surface.tif",
+    ]
+
+
+def test_bedmap2_updated_archive(fake_bedmap2, tmp_path):
+    "Files extracted from an old archive shouldn't be reused"
+    names = fetch_bedmap2(["bed", "surface"], load=False)
+    # Update the archive on the server and its hash in the registry
+    served = str(tmp_path / "server" / "bedmap2_tiff.zip")
+    with ZipFile(served, "a") as archive:
+        archive.comment = b"updated"
+    bedmap2.REGISTRY.registry["bedmap2_tiff.zip"] = file_hash(served)
+    assert fetch_bedmap2("bed", load=False) == names[:1]
+    with ZipFile(str(tmp_path / "cache" / "bedmap2_tiff.zip")) as archive:
+        assert archive.comment == b"updated"
+    assert os.listdir(str(fake_bedmap2)) == ["bedmap2_bed.tif"]
+    # The index was cleared so the other dataset is extracted again
+    assert fetch_bedmap2("surface", load=False) == names[1:]
+    assert os.path.exists(names[1])
+
+
+def test_bedmap2_load(fake_bedmap2):  # pylint: disable=unused-argument
+    "Load the datasets with the windowed reader"
+    grid = fetch_bedmap2(["bed", "surface"], chunks=(16, 16))
+    assert set(grid.data_vars) == {"bed", "surface"}
+    assert grid.bed.dims == ("y", "x")
+    assert grid.bed.chunks is not None
+    assert grid.bed.attrs["units"] == "meters"
+    assert grid.x.attrs["units"] == "meters"
+    assert grid.attrs["EPSG"] == "3031"
+    npt.assert_allclose(grid.x, -29500 + 1000 * np.arange(50))
+    npt.assert_allclose(grid.y, 24500 - 1000 * np.arange(60))
+    bed = grid.bed.values
+    assert np.isnan(bed[:, -1]).all()
+    npt.assert_allclose(bed[:, :-1], np.arange(60)[:, np.newaxis] + 0 * bed[:, :-1])
+    eager = fetch_bedmap2("bed", chunks=None)
+    assert isinstance(eager.bed.data, np.ndarray)
+    npt.assert_allclose(eager.bed, bed)
+
+
+def test_bedmap2_nodata(fake_bedmap2):  # pylint: disable=unused-argument
+    "Check the data types and no data values"
+    dataset = "thickness_uncertainty_5km"
+    grid = fetch_bedmap2(dataset)
+    assert grid[dataset].dtype == np.float32
+    assert np.isnan(grid[dataset].values[:, -1]).all()
+    grid = fetch_bedmap2(dataset, nodata="float64")
+    assert grid[dataset].dtype == np.float64
+    assert np.isnan(grid[dataset].values[:, -1]).all()
+    native = fetch_bedmap2(dataset, nodata="native", chunks=None)
+    assert native[dataset].dtype == np.uint16
+    assert native[dataset].attrs["_FillValue"] == 9999
+    assert (native[dataset].values[:, -1] == 9999).all()
+    npt.assert_allclose(xr.decode_cf(native)[dataset], grid[dataset])
+    with pytest.raises(ValueError):
+        fetch_bedmap2(dataset, nodata="bla")
+
+
+def test_bedmap2_cog(fake_bedmap2, monkeypatch):
+    "Convert the datasets to Cloud-Optimized GeoTIFFs and load the overviews"
+    monkeypatch.setattr(geotiff, "COG_BLOCKSIZE", 16)
+    monkeypatch.setattr(geotiff, "COG_OVERVIEW_SIZE", 10)
+    names = fetch_bedmap2(["bed", "rockmask"], cog=True, load=False)
+    assert [os.path.basename(name) for name in names] == [
+        "bedmap2_bed.cog.tif",
+        "bedmap2_rockmask.cog.tif",
+    ]
+    assert sorted(os.listdir(str(fake_bedmap2))) == [
+        "bedmap2_bed.cog.tif",
+        "bedmap2_bed.tif",
+        "bedmap2_rockmask.cog.tif",
+        "bedmap2_rockmask.tif",
+    ]
+    full = fetch_bedmap2(["bed", "rockmask"])
+    npt.assert_allclose(fetch_bedmap2(["bed", "rockmask"], cog=True).bed, full.bed)
+    grid = fetch_bedmap2(["bed", "rockmask"], overview_level=0)
+    assert grid.bed.shape == (30, 25)
+    npt.assert_allclose(grid.x, -29000 + 2000 * np.arange(25))
+    # Averages of 2 rows for the data and the values of one of the rows for
+    # the masks
+    npt.assert_allclose(grid.bed.values[:, 0], 0.5 + 2 * np.arange(30))
+    npt.assert_allclose(grid.rockmask.values[:, 0], 2 * np.arange(30))
+    assert fetch_bedmap2("bed", overview_level=1).bed.shape == (15, 13)
+
+
+def test_bedmap2_align(fake_bedmap2):  # pylint: disable=unused-argument
+    "Combine the 1 km and 5 km grids"
+    datasets = ["bed", "thickness_uncertainty_5km"]
+    # The union of the points of both grids (5 km points are also 1 km points
+    # in the fake data)
+    native = fetch_bedmap2(datasets)
+    assert native.thickness_uncertainty_5km.shape == (60, 50)
+    assert np.isnan(native.thickness_uncertainty_5km.values[1]).all()
+    # Each grid on its own Dataset
+    bed, uncertainty = fetch_bedmap2(datasets, align="separate")
+    assert set(bed.data_vars) == {"bed"}
+    assert set(uncertainty.data_vars) == {"thickness_uncertainty_5km"}
+    assert bed.bed.shape == (60, 50)
+    assert uncertainty.thickness_uncertainty_5km.shape == (12, 10)
+    assert bed.attrs["EPSG"] == uncertainty.attrs["EPSG"] == "3031"
+    assert len(fetch_bedmap2(["bed", "surface"], align="separate")) == 1
+    # Nearest neighbor interpolation onto the 1 km grid
+    rows = np.clip(np.round((1000 * np.arange(60) - 2000) / 5000), 0, 11)
+    for chunks in [None, (16, 16)]:
+        grid = fetch_bedmap2(datasets, align="upsample", chunks=chunks)
+        upsampled = grid.thickness_uncertainty_5km
+        assert upsampled.shape == (60, 50)
+        assert (upsampled.chunks is None) == (chunks is None)
+        assert upsampled.attrs["res"] == (1000, 1000)
+        npt.assert_allclose(grid.x, bed.x)
+        npt.assert_allclose(grid.y, bed.y)
+        npt.assert_allclose(
+            upsampled.values[:, :45], rows[:, np.newaxis] + np.zeros(45)
+        )
+        assert np.isnan(upsampled.values[:, 45:]).all()
+    # Bilinear interpolation
+    grid = fetch_bedmap2(
+        datasets, align="upsample", interpolation="bilinear", chunks=(16, 16)
+    )
+    assert grid.thickness_uncertainty_5km.chunks is not None
+    npt.assert_allclose(
+        grid.thickness_uncertainty_5km.values[2:57, 3:42],
+        (1000 * np.arange(2, 57)[:, np.newaxis] - 2000) / 5000 + 0 * np.arange(3, 42),
+    )
+    with pytest.raises(ValueError):
+        fetch_bedmap2(datasets, align="bla")
+    with pytest.raises(ValueError):
+        fetch_bedmap2(datasets, align="upsample", interpolation="bla")
+
+
+def test_upsample_outside():
+    "Points of the fine grid outside of the coarse grid should be NaN"
+    # The coarse cells cover x from 0 to 20 km and the fine ones 0 to 30 km
+    coarse = xr.DataArray(
+        np.arange(4.0)[np.newaxis, :] + np.zeros((3, 1)),
+        coords={"y": 2500 + 5000 * np.arange(3), "x": 2500 + 5000 * np.arange(4)},
+        dims=("y", "x"),
+        attrs={"res": (5000, 5000), "transform": None},
+    )
+    fine = xr.DataArray(
+        np.zeros((15, 30)),
+        coords={"y": 500 + 1000 * np.arange(15), "x": 500 + 1000 * np.arange(30)},
+        dims=("y", "x"),
+        attrs={"res": (1000, 1000), "transform": None},
+    )
+    upsampled = upsample([fine, coarse], "nearest")[1]
+    assert upsampled.shape == (15, 30)
+    expected = np.repeat(np.arange(4.0), 5)[np.newaxis, :] + np.zeros((15, 1))
+    npt.assert_allclose(upsampled.values[:, :20], expected)
+    assert np.isnan(upsampled.values[:, 20:]).all()
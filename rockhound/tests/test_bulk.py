@@ -0,0 +1,84 @@
+"""
+Test the bulk download of files in the registry.
+"""
+import os
+import gzip
+import time
+
+import pytest
+
+from .. import bulk
+from ..bulk import prefetch, select_files
+from ..__main__ import main
+from .utils import serve_directory, make_registry, write_files
+
+
+def test_prefetch_select_files():
+    "Check that datasets and patterns select the right files"
+    assert select_files(None) == select_files(["*"])
+    assert select_files("prem") == ["PREM_1s.csv"]
+    assert set(select_files("etopo1")) == {
+        "ETOPO1_Ice_g_gmt4.grd.gz",
+        "ETOPO1_Bed_g_gmt4.grd.gz",
+    }
+    assert len(select_files("seafloor_age")) == 4
+    assert len(select_files(["alu_slab2_*", "prem"])) == 6
+    with pytest.raises(ValueError):
+        select_files(["bla"])
+
+
+def make_server_files(directory):
+    "Create a gzipped file and a plain file to be served"
+    files = write_files(directory, ["plain.csv"], size=2000)
+    fname = os.path.join(str(directory), "compressed.grd.gz")
+    with gzip.open(fname, "wb") as fout:
+        fout.write(b"some data" * 100)
+    files["compressed.grd.gz"] = fname
+    return files
+
+
+def test_prefetch(tmp_path, monkeypatch):
+    "Download files concurrently and process the compressed ones"
+    served = tmp_path / "server"
+    served.mkdir()
+    files = make_server_files(served)
+    latency = 0.5
+    with serve_directory(served, latency=latency) as url:
+        registry = make_registry(tmp_path / "cache", url, files)
+        monkeypatch.setattr(bulk, "REGISTRY", registry)
+        start = time.time()
+        report = prefetch(workers=2)
+        elapsed = time.time() - start
+        assert elapsed < 2 * latency
+        assert report["downloaded"].all()
+        assert report["error"].isnull().all()
+        report = report.set_index("file")
+        assert report.loc["plain.csv", "size"] == 2000
+        path = report.loc["compressed.grd.gz", "path"]
+        assert path.endswith("compressed.grd.gz.decomp")
+        with open(path, "rb") as fin:
+            assert fin.read() == b"some data" * 100
+        assert report.loc["compressed.grd.gz", "size"] == 900
+        # The compressed file isn't kept
+        assert not (tmp_path / "cache" / "compressed.grd.gz").exists()
+        # Running again should not download anything
+        report = prefetch()
+        assert not report["downloaded"].any()
+
+
+def test_prefetch_cli(tmp_path, monkeypatch, capsys):
+    "Run the command line interface and check the failure report"
+    served = tmp_path / "server"
+    served.mkdir()
+    files = make_server_files(served)
+    with serve_directory(served) as url:
+        registry = make_registry(tmp_path / "cache", url, files)
+        os.remove(files["plain.csv"])
+        monkeypatch.setattr(bulk, "REGISTRY", registry)
+        assert main(["prefetch", "*.gz", "--workers", "1"]) == 0
+        output = capsys.readouterr().out
+        assert "compressed.grd.gz" in output
+        assert "plain.csv" not in output
+        assert main(["prefetch"]) == 1
+        output = capsys.readouterr().out
+        assert "failed" in output
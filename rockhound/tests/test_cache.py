@@ -0,0 +1,212 @@
+"""
+Test the in-memory cache of loaded datasets.
+"""
+import os
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+import xarray as xr
+
+from .. import cache, enable_cache, disable_cache, cache_info
+from ..cache import cached, LRUCache
+
+
+@pytest.fixture(name="loader")
+def fixture_loader():
+    """
+    A cached loader function that counts how many times it's called.
+
+    Disables the cache after the test.
+    """
+    calls = []
+
+    @cached
+    def load_grid(size, *, load=True, scale=1, region=None):
+        "Create a grid with size x size points"
+        calls.append((size, scale, region))
+        if not load:
+            return "grid.nc"
+        data = scale * np.ones((size, size))
+        return xr.Dataset(
+            {"grid": (("y", "x"), data)},
+            coords={"x": np.arange(size), "y": np.arange(size)},
+        )
+
+    yield load_grid, calls
+    disable_cache()
+
+
+def test_cache_disabled(loader):
+    "Nothing should be cached by default"
+    load_grid, calls = loader
+    assert cache_info() is None
+    load_grid(10)
+    load_grid(10)
+    assert len(calls) == 2
+
+
+def test_cache_hits(loader):
+    "Repeated calls with the same arguments should be cached"
+    load_grid, calls = loader
+    enable_cache()
+    first = load_grid(10)
+    # Defaults and keyword arguments produce the same key
+    second = load_grid(size=10, scale=1)
+    assert len(calls) == 1
+    assert first is not second
+    npt.assert_allclose(first.grid, second.grid)
+    info = cache_info()
+    assert (info.hits, info.misses, info.size) == (1, 1, 1)
+    assert info.bytes == first.nbytes
+    load_grid(10, scale=2)
+    load_grid(10, region=[1, 2, 3, 4])
+    load_grid(10, region=[1, 2, 3, 4])
+    assert len(calls) == 3
+    assert cache_info().hits == 2
+    # File names are never cached
+    assert load_grid(10, load=False) == "grid.nc"
+    assert load_grid(10, load=False) == "grid.nc"
+    assert len(calls) == 5
+    disable_cache()
+    assert cache_info() is None
+    load_grid(10)
+    assert len(calls) == 6
+
+
+def test_cache_read_only(loader):
+    "Cached data can't be changed in place but the copies can be changed"
+    load_grid, _ = loader
+    enable_cache()
+    grid = load_grid(5)
+    with pytest.raises(ValueError):
+        grid.grid.values[0, 0] = 10
+    grid["other"] = 2 * grid.grid
+    grid.attrs["title"] = "changed"
+    again = load_grid(5)
+    assert set(again.data_vars) == {"grid"}
+    assert "title" not in again.attrs
+    writable = again.copy(deep=True)
+    writable.grid.values[0, 0] = 10
+    npt.assert_allclose(load_grid(5).grid.values[0, 0], 1)
+
+
+def test_cache_dataframe():
+    "DataFrames are cached read-only"
+    calls = []
+
+    @cached
+    def load_table():
+        "Create a table"
+        calls.append(1)
+        return pd.DataFrame({"a": np.arange(3.0), "b": np.ones(3)})
+
+    enable_cache()
+    try:
+        table = load_table()
+        with pytest.raises(ValueError):
+            table["a"].to_numpy()[0] = 10
+        table["c"] = 1
+        assert list(load_table().columns) == ["a", "b"]
+        assert len(calls) == 1
+    finally:
+        disable_cache()
+
+
+def test_cache_dataframe_mixed_dtypes():
+    "DataFrames with several data types are copied on every call"
+
+    @cached
+    def load_table():
+        "Create a table with integer and float columns"
+        return pd.DataFrame({"a": np.arange(3), "b": np.ones(3)})
+
+    enable_cache()
+    try:
+        table = load_table()
+        table.loc[0, "b"] = 10
+        table.loc[1, "a"] = 10
+        npt.assert_allclose(load_table().b, 1)
+        npt.assert_allclose(load_table().a, [0, 1, 2])
+        assert cache_info().size == 1
+    finally:
+        disable_cache()
+
+
+def test_cache_eviction(loader):
+    "Least recently used datasets should be evicted when over the budget"
+    load_grid, calls = loader
+    size = load_grid(10).nbytes
+    enable_cache(max_bytes=int(2.5 * size))
+    load_grid(10, scale=1)
+    load_grid(10, scale=2)
+    load_grid(10, scale=1)
+    load_grid(10, scale=3)
+    assert cache_info().size == 2
+    assert cache_info().bytes == 2 * size
+    # Scale 2 was the least recently used
+    load_grid(10, scale=1)
+    load_grid(10, scale=3)
+    assert len(calls) == 4
+    load_grid(10, scale=2)
+    assert len(calls) == 5
+    # Too large to be cached
+    load_grid(20)
+    load_grid(20)
+    assert len(calls) == 7
+    assert cache.CACHE.nbytes <= 2.5 * size
+
+
+def test_cache_lazy(tmp_path):
+    "Lazy variables are loaded before caching and lazy calls aren't cached"
+    fname = str(tmp_path / "grid.nc")
+    xr.Dataset(
+        {"grid": (("y", "x"), np.ones((100, 100)))},
+        coords={"x": np.arange(100), "y": np.arange(100)},
+    ).to_netcdf(fname)
+    calls = []
+
+    @cached
+    def load_grid(lazy=False, chunks=None):
+        "Open the grid lazily"
+        calls.append((lazy, chunks))
+        grid = xr.open_dataset(fname, chunks=chunks)
+        grid["small"] = ("x", np.zeros(100))
+        return grid
+
+    enable_cache(max_bytes=100000)
+    try:
+        grid = load_grid()
+        assert cache_info().size == 1
+        assert cache_info().bytes == 100 * 100 * 8 + 3 * 800
+        with pytest.raises(ValueError):
+            grid.grid.values[0, 0] = 10
+        # The cached data doesn't need the file anymore
+        os.remove(fname)
+        npt.assert_allclose(load_grid().grid, 1)
+        assert len(calls) == 1
+        with pytest.raises(OSError):
+            load_grid(lazy=True)
+        with pytest.raises(OSError):
+            load_grid(chunks=10)
+        assert len(calls) == 3
+        assert cache_info().size == 1
+    finally:
+        disable_cache()
+
+
+def test_lru_cache():
+    "Check the counters and eviction order of the cache"
+    lru = LRUCache(max_bytes=10)
+    assert lru.get("a") is None
+    lru.put("a", 1, 4)
+    lru.put("b", 2, 4)
+    assert lru.get("a") == 1
+    lru.put("c", 3, 4)
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+    lru.put("c", 4, 2)
+    assert lru.info() == (2, 2, 10, 6, 2)
+    lru.put("d", 5, 11)
+    assert lru.get("d") is None
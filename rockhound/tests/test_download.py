@@ -0,0 +1,289 @@
+"""
+Test the download functions that resume downloads, reuse connections, and
+decompress files on the fly.
+"""
+import os
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import urllib3
+
+from .. import download, registry as rockhound_registry
+from ..download import (
+    fetch_gunzip,
+    get_session,
+    partial_file,
+    registry_name,
+    ResumableDownloader,
+)
+from ..registry import fetch_files, LazyRegistry
+from .utils import serve_directory, make_registry, write_files
+
+
+def write_gzip(path, data):
+    "Write the data to a gzip file with two members and return the file name"
+    fname = str(path / "data.txt.gz")
+    with open(fname, "wb") as output:
+        output.write(gzip.compress(data[:1000]))
+        output.write(gzip.compress(data[1000:]))
+    return fname
+
+
+def test_fetch_gunzip(tmp_path):
+    "Download and decompress without saving the compressed file"
+    served = tmp_path / "server"
+    served.mkdir()
+    data = os.urandom(300000) * 10
+    fname = write_gzip(served, data)
+    cache = tmp_path / "cache"
+    with serve_directory(served) as url:
+        registry = make_registry(cache, url, {"data.txt.gz": fname})
+        output = fetch_gunzip(registry, "data.txt.gz")
+    assert output == str(cache / "data.txt.gz.decomp")
+    with open(output, "rb") as decompressed:
+        assert decompressed.read() == data
+    assert sorted(os.listdir(str(cache))) == [
+        "data.txt.gz.decomp",
+        "data.txt.gz.decomp.hash",
+    ]
+    # The server is down so the existing file must be used
+    assert fetch_gunzip(registry, "data.txt.gz") == output
+    # Download again if the hash in the registry changes
+    registry.registry["data.txt.gz"] = "0" * 64
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetch_gunzip(registry, "data.txt.gz")
+
+
+def test_fetch_gunzip_wrong_hash(tmp_path):
+    "Files with the wrong hash should be deleted"
+    served = tmp_path / "server"
+    served.mkdir()
+    fname = write_gzip(served, b"some data" * 1000)
+    cache = tmp_path / "cache"
+    with serve_directory(served) as url:
+        registry = make_registry(cache, url, {"data.txt.gz": fname})
+        registry.registry["data.txt.gz"] = "sha256:" + "0" * 64
+        with pytest.raises(ValueError):
+            fetch_gunzip(registry, "data.txt.gz")
+        assert os.listdir(str(cache)) == []
+        # Missing files raise the HTTP error
+        registry.registry["missing.txt.gz"] = "0" * 64
+        with pytest.raises(requests.exceptions.HTTPError):
+            fetch_gunzip(registry, "missing.txt.gz")
+        assert os.listdir(str(cache)) == []
+
+
+def test_fetch_gunzip_existing(tmp_path):
+    "Compressed files downloaded by Pooch should be decompressed by Pooch"
+    served = tmp_path / "server"
+    served.mkdir()
+    data = b"some data" * 1000
+    fname = write_gzip(served, data)
+    cache = tmp_path / "cache"
+    with serve_directory(served) as url:
+        registry = make_registry(cache, url, {"data.txt.gz": fname})
+        registry.fetch("data.txt.gz")
+    output = fetch_gunzip(registry, "data.txt.gz")
+    with open(output, "rb") as decompressed:
+        assert decompressed.read() == data
+
+
+def test_fetch_gunzip_resume(tmp_path):
+    "Resume the download if the connection drops"
+    served = tmp_path / "server"
+    served.mkdir()
+    data = os.urandom(300000)
+    fname = write_gzip(served, data)
+    cache = tmp_path / "cache"
+    with serve_directory(served, ranges=True, failures=2) as url:
+        registry = make_registry(cache, url, {"data.txt.gz": fname})
+        output = fetch_gunzip(registry, "data.txt.gz")
+    with open(output, "rb") as decompressed:
+        assert decompressed.read() == data
+
+
+@pytest.mark.parametrize("segments", [1, 3])
+def test_resumable_downloader(tmp_path, monkeypatch, segments):
+    "Resume interrupted downloads in the same call"
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 1000)
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, ["data.bin"], size=300000)
+    cache = tmp_path / "cache"
+    with serve_directory(served, ranges=True, failures=4) as url:
+        registry = make_registry(cache, url, files)
+        downloader = ResumableDownloader(segments=segments)
+        path = registry.fetch("data.bin", downloader=downloader)
+        assert downloader(url + "data.bin", None, registry, check_only=True)
+        assert not downloader(url + "missing.bin", None, registry, check_only=True)
+    with open(path, "rb") as downloaded, open(files["data.bin"], "rb") as original:
+        assert downloaded.read() == original.read()
+    assert os.listdir(str(cache)) == ["data.bin"]
+
+
+def test_resumable_downloader_partial(tmp_path):
+    "Keep the partial file and resume from it in the next call"
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, ["data.bin"], size=300000)
+    cache = tmp_path / "cache"
+    with serve_directory(served, ranges=True, failures=1) as url:
+        registry = make_registry(cache, url, files)
+        downloader = ResumableDownloader(segments=1, retries=0)
+        with pytest.raises(urllib3.exceptions.HTTPError):
+            registry.fetch("data.bin", downloader=downloader)
+        part = partial_file(url + "data.bin", registry)
+        assert os.path.dirname(part) == str(cache)
+        assert os.path.basename(part).startswith("data.bin.")
+        assert os.path.getsize(part) == 150000
+        path = registry.fetch("data.bin", downloader=downloader)
+    with open(path, "rb") as downloaded, open(files["data.bin"], "rb") as original:
+        assert downloaded.read() == original.read()
+    assert os.listdir(str(cache)) == ["data.bin"]
+
+
+def test_resumable_downloader_query_urls(tmp_path):
+    "Files with the same URL path and different queries shouldn't collide"
+    served = tmp_path / "server"
+    served.mkdir()
+    names = ["zone_slab2_{}.grd".format(i) for i in range(5)]
+    files = write_files(served, names, size=300000)
+    with serve_directory(served, latency=0.2, ranges=True) as url:
+        registry = make_registry(tmp_path / "cache", url, files, query=True)
+        parts = {partial_file(registry.get_url(name), registry) for name in names}
+        assert len(parts) == len(names)
+        downloader = ResumableDownloader()
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            paths = list(
+                executor.map(
+                    lambda name: registry.fetch(name, downloader=downloader), names
+                )
+            )
+    for name, path in zip(names, paths):
+        with open(path, "rb") as downloaded, open(files[name], "rb") as original:
+            assert downloaded.read() == original.read()
+    assert sorted(os.listdir(str(tmp_path / "cache"))) == names
+
+
+def test_resumable_downloader_stale_part(tmp_path):
+    "Partial files of an old version of the file shouldn't be resumed"
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, ["data.bin"], size=3000)
+    cache = tmp_path / "cache"
+    with serve_directory(served, ranges=True) as url:
+        registry = make_registry(cache, url, files)
+        old_hash = registry.registry["data.bin"]
+        registry.registry["data.bin"] = "0" * 64
+        stale = partial_file(url + "data.bin", registry)
+        os.makedirs(str(cache))
+        with open(stale, "wb") as part:
+            part.write(b"old version")
+        registry.registry["data.bin"] = old_hash
+        assert partial_file(url + "data.bin", registry) != stale
+        path = registry.fetch("data.bin", downloader=ResumableDownloader())
+    with open(path, "rb") as downloaded, open(files["data.bin"], "rb") as original:
+        assert downloaded.read() == original.read()
+
+
+def test_resumable_downloader_no_ranges(tmp_path):
+    "Download the whole file if the server doesn't support ranges"
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, ["data.bin"], size=3000)
+    cache = tmp_path / "cache"
+    with serve_directory(served) as url:
+        registry = make_registry(cache, url, files)
+        path = registry.fetch("data.bin", downloader=ResumableDownloader())
+    with open(path, "rb") as downloaded, open(files["data.bin"], "rb") as original:
+        assert downloaded.read() == original.read()
+    with pytest.raises(ValueError):
+        ResumableDownloader(segments=0)
+
+
+def test_resumable_downloader_no_head(tmp_path, monkeypatch):
+    "Download in a single stream if the server rejects HEAD requests"
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 1000)
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, ["data.bin"], size=30000)
+    cache = tmp_path / "cache"
+    with serve_directory(served, ranges=True, failures=1, head=False) as url:
+        registry = make_registry(cache, url, files)
+        downloader = ResumableDownloader(segments=3, fname="data.bin")
+        path = registry.fetch("data.bin", downloader=downloader)
+        assert downloader(url + "data.bin", None, registry, check_only=True)
+        assert not downloader(url + "missing.bin", None, registry, check_only=True)
+    with open(path, "rb") as downloaded, open(files["data.bin"], "rb") as original:
+        assert downloaded.read() == original.read()
+    assert os.listdir(str(cache)) == ["data.bin"]
+
+
+def test_resumable_downloader_stale_segments(tmp_path, monkeypatch):
+    "Segments downloaded with different bounds shouldn't be reused"
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 1000)
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, ["data.bin"], size=3000)
+    cache = tmp_path / "cache"
+    with serve_directory(served, ranges=True) as url:
+        registry = make_registry(cache, url, files)
+        part = partial_file(url + "data.bin", registry, "data.bin")
+        # Segments of an older download split in 2 instead of 3
+        os.makedirs(str(cache))
+        for bounds in ["0-1500", "1500-3000"]:
+            with open("{}.{}".format(part, bounds), "wb") as piece:
+                piece.write(b"x" * 1000)
+        downloader = ResumableDownloader(segments=3, fname="data.bin")
+        path = registry.fetch("data.bin", downloader=downloader)
+    with open(path, "rb") as downloaded, open(files["data.bin"], "rb") as original:
+        assert downloaded.read() == original.read()
+    assert os.listdir(str(cache)) == ["data.bin"]
+
+
+def test_partial_file_names(tmp_path):
+    "Find the registry file names of URLs to name the partial files"
+    files = {name: str(tmp_path / name) for name in ["a.bin", "b.bin"]}
+    for fname in files.values():
+        with open(fname, "wb") as fout:
+            fout.write(b"data")
+    registry = make_registry(tmp_path / "cache", "http://host/", files, query=True)
+    registry.urls.pop("a.bin")
+    assert registry_name("http://host/a.bin", registry) == "a.bin"
+    assert registry_name(registry.get_url("b.bin"), registry) == "b.bin"
+    assert registry_name("http://host/c.bin", registry) is None
+    url = registry.get_url("b.bin")
+    assert partial_file(url, registry, "b.bin") == partial_file(url, registry)
+    assert os.path.basename(partial_file(url, registry)).startswith("b.bin.")
+
+
+def test_pooled_connections(tmp_path, monkeypatch):
+    "Files from the same host should be downloaded over the same connections"
+    monkeypatch.setattr(download, "SESSIONS", {})
+    connections = []
+    connect = urllib3.connection.HTTPConnection.connect
+
+    def counting_connect(self):
+        connections.append(self.host)
+        return connect(self)
+
+    monkeypatch.setattr(urllib3.connection.HTTPConnection, "connect", counting_connect)
+    served = tmp_path / "server"
+    served.mkdir()
+    names = ["data{}.bin".format(i) for i in range(10)]
+    files = write_files(served, names)
+    log = []
+    with serve_directory(served, ranges=True, log=log) as url:
+        registry = LazyRegistry(None)
+        registry.pooch = make_registry(tmp_path / "cache", url, files)
+        monkeypatch.setattr(rockhound_registry, "REGISTRY", registry)
+        paths = fetch_files(names, workers=2)
+        assert get_session(url) is get_session(url + "data0.bin")
+    for name, path in zip(names, paths):
+        with open(path, "rb") as downloaded, open(files[name], "rb") as original:
+            assert downloaded.read() == original.read()
+    assert 1 <= len(connections) <= 2
+    # The default downloader doesn't need a HEAD request before each file
+    assert sorted(log) == sorted(("GET", "/" + name) for name in names)
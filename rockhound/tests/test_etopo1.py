@@ -1,9 +1,15 @@
 """
 Test the ETOPO1 loading function.
 """
+import gzip
+
 import pytest
+import numpy as np
+import numpy.testing as npt
+import xarray as xr
 
-from .. import fetch_etopo1
+from .. import etopo1, fetch_etopo1
+from .utils import serve_registry
 
 
 def test_etopo1_invalid_version():
@@ -30,3 +36,137 @@ def test_etopo1():
     assert grid.bedrock.shape == (10801, 21601)
     assert grid.attrs["title"] == "ETOPO1 Bedrock Relief"
     assert tuple(grid.dims) == ("latitude", "longitude")
+
+
+@pytest.fixture(name="fake_etopo1")
+def fixture_fake_etopo1(tmp_path, monkeypatch):
+    """
+    Serve small grids with the same layout as ETOPO1 from a local server.
+
+    Grids have a 1 degree spacing and the relief is the longitude plus 1000
+    times the latitude.
+    """
+    longitude = np.linspace(-180, 180, 361)
+    latitude = np.linspace(-90, 90, 181)
+    relief = longitude[np.newaxis, :] + 1000 * latitude[:, np.newaxis]
+    grid = xr.Dataset(
+        {"z": (("y", "x"), relief.astype("int32"))},
+        coords={"x": longitude, "y": latitude},
+    )
+    content = gzip.compress(grid.to_netcdf(format="NETCDF3_64BIT"))
+    files = {
+        "ETOPO1_Ice_g_gmt4.grd.gz": content,
+        "ETOPO1_Bed_g_gmt4.grd.gz": content,
+    }
+    with serve_registry(tmp_path, monkeypatch, etopo1, files):
+        yield grid.rename(z="ice", x="longitude", y="latitude")
+
+
+def test_etopo1_zarr(fake_etopo1):
+    "Convert the grid into Zarr and check that it matches the netCDF version"
+    pytest.importorskip("zarr")
+    store = fetch_etopo1(version="ice", load=False, format="zarr")
+    assert store.endswith("ETOPO1_Ice_g_gmt4.zarr")
+    grid = fetch_etopo1(version="ice", format="zarr")
+    assert grid.ice.chunks is not None
+    assert grid.attrs["title"] == "ETOPO1 Ice Surface Relief"
+    assert grid.ice.attrs["units"] == "meters"
+    xr.testing.assert_equal(grid.ice, fake_etopo1.ice)
+    netcdf = fetch_etopo1(version="ice")
+    xr.testing.assert_identical(grid.load(), netcdf.load())
+    # The store is reused by later calls
+    assert fetch_etopo1(version="ice", load=False, format="zarr") == store
+
+
+def test_etopo1_invalid_format():
+    "Use invalid format"
+    with pytest.raises(ValueError):
+        fetch_etopo1(version="ice", format="bla")
+
+
+def test_etopo1_region(fake_etopo1):
+    "Load only a region of the grid, including crossing the antimeridian"
+    grid = fetch_etopo1(version="ice", region=(-10, 20, -5, 5))
+    assert grid.attrs["title"] == "ETOPO1 Ice Surface Relief"
+    xr.testing.assert_equal(
+        grid.ice, fake_etopo1.ice.sel(longitude=slice(-10, 20), latitude=slice(-5, 5))
+    )
+    grid = fetch_etopo1(version="ice", region=(170, -170, -5, 5))
+    npt.assert_allclose(grid.longitude, np.arange(170, 191))
+    npt.assert_allclose(
+        grid.ice.sel(longitude=185),
+        fake_etopo1.ice.sel(longitude=-175, latitude=slice(-5, 5)),
+    )
+
+
+def test_etopo1_resolution(fake_etopo1):  # pylint: disable=unused-argument
+    "Calculate and load coarser versions of the grid"
+    fname = fetch_etopo1(version="bedrock", load=False, resolution="4min")
+    assert fname.endswith("ETOPO1_Bed_g_gmt4_4min_mean.nc")
+    grid = fetch_etopo1(version="bedrock", resolution="4min")
+    assert grid.attrs["title"] == "ETOPO1 Bedrock Relief"
+    assert grid.attrs["resolution"] == "4min"
+    assert grid.bedrock.attrs["units"] == "meters"
+    assert grid.bedrock.dtype == np.float32
+    # Relief is linear so the block means are the values at the block centers
+    assert grid.bedrock.shape == (45, 90)
+    npt.assert_allclose(grid.longitude, np.arange(-178, 180, 4))
+    npt.assert_allclose(grid.latitude, np.arange(-88, 90, 4))
+    expected = grid.longitude + 1000 * grid.latitude
+    npt.assert_allclose(grid.bedrock, expected.transpose(*grid.bedrock.dims))
+    # The cached file is reused and can be combined with a region
+    grid = fetch_etopo1(version="bedrock", resolution="4min", region=(0, 10, 0, 10))
+    npt.assert_allclose(grid.longitude, [2, 6, 10])
+    grid = fetch_etopo1(version="bedrock", resolution="1deg", reduction="median")
+    assert grid.bedrock.shape == (3, 6)
+    assert grid.attrs["reduction"] == "median"
+    npt.assert_allclose(grid.longitude, [-150, -90, -30, 30, 90, 150])
+    npt.assert_allclose(grid.latitude, [-60, 0, 60])
+
+
+def test_etopo1_resolution_edges(tmp_path, monkeypatch):
+    "The edge blocks should include the poles and the antimeridian"
+    longitude = np.linspace(-180, 180, 361)
+    latitude = np.linspace(-90, 90, 181)
+    # Only the rows at the poles and the columns at -180 and 180 aren't zero
+    relief = np.zeros((latitude.size, longitude.size), dtype="int32")
+    relief[[0, -1], :] = 25
+    relief[:, [0, -1]] = 25
+    grid = xr.Dataset(
+        {"z": (("y", "x"), relief)}, coords={"x": longitude, "y": latitude}
+    )
+    content = gzip.compress(grid.to_netcdf(format="NETCDF3_64BIT"))
+    files = {"ETOPO1_Ice_g_gmt4.grd.gz": content}
+    # Read several bands of rows (the last one is shorter)
+    monkeypatch.setattr(etopo1, "BAND_ROWS", 8)
+    with serve_registry(tmp_path, monkeypatch, etopo1, files):
+        grid = fetch_etopo1(version="ice", resolution="4min").load()
+    npt.assert_allclose(grid.longitude, np.arange(-178, 180, 4))
+    npt.assert_allclose(grid.latitude, np.arange(-88, 90, 4))
+    # Blocks have 5x5 points and share the points on their edges
+    npt.assert_allclose(grid.ice[1:-1, 1:-1], 0)
+    npt.assert_allclose(grid.ice[[0, -1], 1:-1], 25 * 5 / 25)
+    npt.assert_allclose(grid.ice[1:-1, [0, -1]], 25 * 5 / 25)
+    npt.assert_allclose(grid.ice[[0, 0, -1, -1], [0, -1, 0, -1]], 25 * 9 / 25)
+
+
+def test_etopo1_invalid_resolution():
+    "Use invalid resolutions and reductions"
+    with pytest.raises(ValueError):
+        fetch_etopo1(version="ice", resolution="bla")
+    with pytest.raises(ValueError):
+        fetch_etopo1(version="ice", resolution="4min", reduction="bla")
+    with pytest.raises(ValueError):
+        fetch_etopo1(version="ice", resolution="4min", format="zarr")
+
+
+def test_etopo1_chunks(fake_etopo1):
+    "Load the grids as Dask arrays"
+    grid = fetch_etopo1("ice", chunks="auto")
+    assert grid.ice.chunks == ((181,), (361,))
+    assert grid.attrs["title"] == "ETOPO1 Ice Surface Relief"
+    npt.assert_allclose(grid.ice.mean().compute(), fake_etopo1.ice.mean())
+    grid = fetch_etopo1("ice", chunks={"latitude": 50}, region=(-10, 10, -60, 60))
+    assert grid.ice.chunks[0] == (20, 50, 50, 1)
+    grid = fetch_etopo1("ice", chunks={"latitude": 9}, resolution="4min")
+    assert grid.ice.chunks[0] == (9, 9, 9, 9, 9)
@@ -0,0 +1,144 @@
+"""
+Test the GeoTIFF reader.
+"""
+import gc
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+import rasterio
+
+from .. import geotiff
+from ..geotiff import open_geotiff, convert_to_cog
+
+
+def write_geotiff(fname, data, **kwargs):
+    "Write a grid to a GeoTIFF file with 10 m pixels"
+    with rasterio.open(
+        str(fname),
+        "w",
+        driver="GTiff",
+        height=data.shape[0],
+        width=data.shape[1],
+        count=1,
+        dtype=data.dtype,
+        crs="EPSG:3031",
+        transform=rasterio.transform.from_origin(1000, 2000, 10, 10),
+        nodata=-1,
+        **kwargs
+    ) as output:
+        output.write(data, 1)
+
+
+@pytest.mark.parametrize(
+    "layout",
+    [dict(), dict(tiled=True, blockxsize=32, blockysize=16)],
+    ids=["strips", "tiles"],
+)
+def test_open_geotiff(tmp_path, layout):
+    "Read striped and tiled files with aligned chunks"
+    data = np.arange(100 * 70, dtype="int16").reshape(100, 70)
+    fname = tmp_path / "grid.tif"
+    write_geotiff(fname, data, **layout)
+    with rasterio.open(str(fname)) as source:
+        blocks = source.block_shapes[0]
+    grid = open_geotiff(str(fname), chunks=(20, 20))
+    # All chunks except the last ones are multiples of the blocks
+    for sizes, block in zip(grid.chunks, blocks):
+        assert all(size % block == 0 for size in sizes[:-1])
+        assert sizes[0] >= 20
+    assert grid.dtype == np.int16
+    assert grid.dims == ("y", "x")
+    npt.assert_allclose(grid.x, 1005 + 10 * np.arange(70))
+    npt.assert_allclose(grid.y, 1995 - 10 * np.arange(100))
+    assert grid.attrs["nodatavals"] == (-1,)
+    assert grid.attrs["crs"] == "EPSG:3031"
+    npt.assert_array_equal(grid.values, data)
+    npt.assert_array_equal(grid[13:57, 5:66].values, data[13:57, 5:66])
+    # Load the data in parallel into numpy arrays
+    grid = open_geotiff(str(fname), chunks=None)
+    assert isinstance(grid.data, np.ndarray)
+    npt.assert_array_equal(grid.values, data)
+    grid = open_geotiff(str(fname), chunks={"x": 30})
+    assert grid.chunks[1][0] % blocks[1] == 0
+    npt.assert_array_equal(grid.values, data)
+
+
+def test_open_geotiff_masked(tmp_path):
+    "Convert the data type and mask the no data values"
+    data = np.arange(40 * 30, dtype="int16").reshape(40, 30)
+    data[::3, ::2] = -1
+    fname = tmp_path / "grid.tif"
+    write_geotiff(fname, data)
+    for chunks in [None, (7, 9)]:
+        grid = open_geotiff(str(fname), chunks=chunks, dtype="float32", masked=True)
+        assert grid.dtype == np.float32
+        expected = data.astype("float32")
+        expected[data == -1] = np.nan
+        npt.assert_array_equal(grid.values, expected)
+    with pytest.raises(ValueError):
+        open_geotiff(str(fname), masked=True)
+
+
+def test_open_geotiff_close(tmp_path, monkeypatch):
+    "The files opened by the reading threads should be closed"
+    opened = []
+    rasterio_open = rasterio.open
+
+    def recording_open(*args, **kwargs):
+        "Record the datasets that are opened"
+        source = rasterio_open(*args, **kwargs)
+        opened.append(source)
+        return source
+
+    monkeypatch.setattr(rasterio, "open", recording_open)
+    data = np.arange(40 * 30, dtype="int16").reshape(40, 30)
+    fname = tmp_path / "grid.tif"
+    write_geotiff(fname, data)
+    # Numpy arrays are read and the files closed right away
+    open_geotiff(str(fname), chunks=None)
+    assert opened and all(source.closed for source in opened)
+    # Dask arrays keep the files open until the grid is closed
+    grid = open_geotiff(str(fname), chunks=(7, 9))
+    grid.compute(scheduler="threads", num_workers=3)
+    assert not all(source.closed for source in opened)
+    grid.close()
+    assert all(source.closed for source in opened)
+    # Reading again opens the files again
+    npt.assert_array_equal(grid.values, data)
+    assert not all(source.closed for source in opened)
+    # Or until the grid is garbage collected
+    del grid
+    gc.collect()
+    assert all(source.closed for source in opened)
+
+
+def test_convert_to_cog(tmp_path, monkeypatch):
+    "Create a tiled and compressed file with overviews"
+    monkeypatch.setattr(geotiff, "COG_BLOCKSIZE", 32)
+    monkeypatch.setattr(geotiff, "COG_OVERVIEW_SIZE", 20)
+    data = np.arange(100 * 70, dtype="float32").reshape(100, 70)
+    fname = tmp_path / "grid.tif"
+    write_geotiff(fname, data)
+    output = str(tmp_path / "grid.cog.tif")
+    assert convert_to_cog(str(fname), output) == output
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "grid.cog.tif",
+        "grid.tif",
+    ]
+    with rasterio.open(output) as source:
+        assert source.block_shapes[0] == (32, 32)
+        assert source.compression == rasterio.enums.Compression.deflate
+        assert source.overviews(1) == [2, 4]
+    npt.assert_array_equal(open_geotiff(output).values, data)
+    # Read the overviews directly
+    grid = open_geotiff(output, overview_level=0)
+    assert grid.shape == (50, 35)
+    npt.assert_allclose(grid.x, 1010 + 20 * np.arange(35))
+    npt.assert_allclose(grid.y, 1990 - 20 * np.arange(50))
+    npt.assert_allclose(grid.values, data.reshape(50, 2, 35, 2).mean(axis=(1, 3)))
+    assert open_geotiff(output, overview_level=1).shape == (25, 18)
+    # Existing files are not converted again
+    modified = (tmp_path / "grid.cog.tif").stat().st_mtime_ns
+    convert_to_cog(str(fname), output)
+    assert (tmp_path / "grid.cog.tif").stat().st_mtime_ns == modified
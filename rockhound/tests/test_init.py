@@ -0,0 +1,63 @@
+"""
+Test the lazy loading of the public API.
+"""
+import subprocess
+import sys
+
+import pytest
+
+import rockhound
+
+# Modules that shouldn't be imported by "import rockhound"
+HEAVY_MODULES = ["xarray", "pandas", "rasterio", "dask", "pooch", "netCDF4"]
+
+
+def run_python(code):
+    "Run Python code in a new interpreter and return the standard output"
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+
+
+def test_import_is_lazy():
+    "Importing the package shouldn't import the heavy dependencies"
+    code = "import sys, rockhound; print(' '.join(sorted(sys.modules)))"
+    modules = run_python(code).split()
+    assert "rockhound" in modules
+    assert not set(HEAVY_MODULES).intersection(modules)
+    # Only the dependencies of the function are imported when it's accessed
+    code = "import sys, rockhound; rockhound.prem_at; print(' '.join(sys.modules))"
+    modules = run_python(code).split()
+    assert "pandas" in modules
+    assert "rasterio" not in modules
+    # rasterio is only imported when GeoTIFF files are read
+    code = (
+        "import sys, rockhound; rockhound.fetch_bedmap2; print(' '.join(sys.modules))"
+    )
+    modules = run_python(code).split()
+    assert "xarray" in modules
+    assert "rasterio" not in modules
+
+
+def test_import_time():
+    "Benchmark the import time against importing the dependencies"
+    code = "import time; start = time.perf_counter(); import {}; print({})"
+    elapsed = "time.perf_counter() - start"
+    lazy = min(float(run_python(code.format("rockhound", elapsed))) for _ in range(3))
+    eager = min(
+        float(run_python(code.format(", ".join(HEAVY_MODULES), elapsed)))
+        for _ in range(3)
+    )
+    assert lazy < eager
+
+
+def test_public_api():
+    "All public functions should be available and listed"
+    for name in rockhound.PUBLIC_API:
+        assert callable(getattr(rockhound, name))
+        assert name in dir(rockhound)
+    with pytest.raises(AttributeError):
+        rockhound.fetch_something_else  # pylint: disable=pointless-statement
@@ -1,7 +1,16 @@
 """
 Test the PREM loading function.
 """
-from ..prem import fetch_prem
+import io
+import os
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from .. import prem as prem_module
+from ..prem import fetch_prem, prem_at, derived_profiles, COLUMNS, DERIVED_COLUMNS
+from .utils import serve_registry
 
 
 def test_prem_file_name_only():
@@ -34,3 +43,123 @@ def test_prem():
     assert prem["Q_mu"].max() == 600
     assert prem["Q_kappa"].min() == 1327.7
     assert prem["Q_kappa"].max() == 57823
+
+
+@pytest.fixture(name="fake_prem")
+def fixture_fake_prem(tmp_path, monkeypatch):
+    """
+    Serve a small csv file with the layout of the PREM file.
+
+    The radius goes from 18 to 0 km with a discontinuity at 10 km. The other
+    columns are 100 - radius (plus the column index) above the discontinuity
+    and 200 - radius below it. Yields the table.
+    """
+    radius = np.array([18, 16, 14, 12, 10, 10, 8, 6, 4, 2, 0], dtype="float64")
+    values = np.where(np.arange(radius.size) < 5, 100, 200) - radius
+    table = np.column_stack([radius, 18 - radius] + [values + i for i in range(2, 10)])
+    content = io.BytesIO()
+    np.savetxt(content, table, delimiter=",", fmt="%.5f")
+    files = {"PREM_1s.csv": content.getvalue()}
+    with serve_registry(tmp_path, monkeypatch, prem_module, files):
+        yield table
+
+
+def test_prem_binary_cache(fake_prem, monkeypatch):
+    "The parsed table should be loaded from the binary cache"
+    prem = fetch_prem()
+    assert list(prem.columns) == COLUMNS
+    npt.assert_allclose(prem.values, fake_prem)
+    folder = os.path.dirname(fetch_prem(load=False))
+    cache = [name for name in os.listdir(folder) if name.endswith(".npy")]
+    assert len(cache) == 1
+    assert cache[0].startswith("PREM_1s.")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("The csv file shouldn't be parsed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(np, "loadtxt", fail)
+        prem = fetch_prem()
+        npt.assert_allclose(prem.values, fake_prem)
+        # Changing the table doesn't change the cache
+        prem.loc[0, "radius"] = -1
+        npt.assert_allclose(fetch_prem().values, fake_prem)
+        # A different hash means that the csv file changed and the cache is
+        # invalid
+        patch.setitem(prem_module.REGISTRY.registry, "PREM_1s.csv", "0" * 64)
+        with pytest.raises(RuntimeError):
+            prem_module.load_table(os.path.join(folder, "PREM_1s.csv"))
+
+
+def test_prem_at(fake_prem):  # pylint: disable=unused-argument
+    "Interpolate the model without crossing the discontinuity"
+    radius = np.array([[18, 17, 13.5, 10.5, 10], [9.9, 3, 0, 18.5, -1]])
+    prem = prem_at(radius=radius)
+    assert list(prem.columns) == COLUMNS
+    npt.assert_allclose(prem.radius, radius.ravel())
+    npt.assert_allclose(prem.depth, 18 - radius.ravel())
+    expected = np.array([82, 83, 86.5, 89.5, 190, 190.1, 197, 200, np.nan, np.nan])
+    for i, column in enumerate(COLUMNS[2:], start=2):
+        npt.assert_allclose(prem[column], expected + i)
+    by_depth = prem_at(depth=18 - radius)
+    npt.assert_allclose(by_depth.values, prem.values)
+    npt.assert_allclose(prem_at(radius=11).density, 91)
+    with pytest.raises(ValueError):
+        prem_at()
+    with pytest.raises(ValueError):
+        prem_at(radius=1, depth=2)
+
+
+def test_prem_derived_profiles():
+    "Check the derived profiles against a homogeneous sphere"
+    radius = np.linspace(6371, 0, 2001)
+    table = np.zeros((radius.size, len(COLUMNS)))
+    table[:, 0] = radius
+    table[:, 1] = 6371 - radius
+    table[:, 2] = 5
+    table[:, 3:5] = 8
+    table[:, 5:7] = 4
+    profiles = derived_profiles(table)
+    density = 5000
+    radius_m = 1e3 * radius
+    gravitational_constant = 6.67430e-11
+    npt.assert_allclose(
+        profiles[:, 0], 4 / 3 * np.pi * radius_m**3 * density, rtol=1e-3, atol=1e19
+    )
+    npt.assert_allclose(
+        profiles[:, 1],
+        4 / 3 * np.pi * gravitational_constant * density * radius_m,
+        rtol=1e-3,
+        atol=5e-3,
+    )
+    pressure = (
+        2
+        / 3
+        * np.pi
+        * gravitational_constant
+        * density**2
+        * (radius_m[0] ** 2 - radius_m**2)
+    )
+    npt.assert_allclose(profiles[:, 2], 1e-9 * pressure, rtol=1e-3)
+    npt.assert_allclose(profiles[:, 4], 1e-9 * density * 4000**2)
+    npt.assert_allclose(
+        profiles[:, 3], 1e-9 * density * (8000**2 - 4 / 3 * 4000**2)
+    )
+    # Same result with increasing radius
+    npt.assert_allclose(derived_profiles(table[::-1]), profiles[::-1])
+
+
+def test_prem_derived(fake_prem):
+    "Derived columns should be added and cached"
+    prem = fetch_prem(derived=True)
+    assert list(prem.columns) == COLUMNS + DERIVED_COLUMNS
+    npt.assert_allclose(prem[COLUMNS].values, fake_prem)
+    # Integrals are zero at the center and the surface
+    assert prem.mass.iloc[-1] == 0
+    assert prem.gravity.iloc[-1] == 0
+    assert prem.pressure.iloc[0] == 0
+    assert (np.diff(prem.mass) <= 0).all()
+    assert (np.diff(prem.pressure) >= 0).all()
+    folder = os.path.dirname(fetch_prem(load=False))
+    assert len([name for name in os.listdir(folder) if name.endswith(".npy")]) == 2
+    npt.assert_allclose(fetch_prem(derived=True).values, prem.values)
@@ -0,0 +1,160 @@
+"""
+Test the custom Pooch processors.
+"""
+import os
+import bz2
+from concurrent.futures.process import BrokenProcessPool
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+from .. import processors
+from ..processors import (
+    UnzipMembers,
+    ParallelDecompress,
+    find_blocks,
+    find_file_blocks,
+    get_pool,
+)
+
+
+def make_archive(path):
+    "Create a zip archive with files inside a folder"
+    fname = str(path / "archive.zip")
+    with ZipFile(fname, "w") as archive:
+        for name in ["first.txt", "second.txt", "third.txt"]:
+            archive.writestr("folder/{}".format(name), name)
+    return fname
+
+
+def test_unzip_members(tmp_path):
+    "Extract only the requested members and reuse them later"
+    fname = make_archive(tmp_path)
+    extract_dir = fname + ".unzip"
+    paths = UnzipMembers(["second.txt"])(fname, "download", None)
+    assert paths == [os.path.join(extract_dir, "folder", "second.txt")]
+    assert os.listdir(os.path.join(extract_dir, "folder")) == ["second.txt"]
+    with open(paths[0]) as fin:
+        assert fin.read() == "second.txt"
+    # Modify the extracted file to check if it's extracted again
+    with open(paths[0], "w") as fout:
+        fout.write("modified")
+    paths = UnzipMembers(["third.txt", "second.txt"])(fname, "fetch", None)
+    assert [os.path.basename(path) for path in paths] == ["third.txt", "second.txt"]
+    assert sorted(os.listdir(os.path.join(extract_dir, "folder"))) == [
+        "second.txt",
+        "third.txt",
+    ]
+    with open(paths[1]) as fin:
+        assert fin.read() == "modified"
+    # Updating the archive extracts the members again and deletes the others
+    paths = UnzipMembers(["second.txt"])(fname, "update", None)
+    with open(paths[0]) as fin:
+        assert fin.read() == "second.txt"
+    assert os.listdir(os.path.join(extract_dir, "folder")) == ["second.txt"]
+
+
+def test_unzip_members_missing(tmp_path):
+    "Raise an error if the member isn't in the archive"
+    fname = make_archive(tmp_path)
+    with pytest.raises(ValueError):
+        UnzipMembers(["first.txt", "bla.txt"])(fname, "download", None)
+
+
+def make_bz2(path):
+    """
+    Create a bzip2 file with two concatenated streams and many blocks.
+
+    Returns the file name and the uncompressed data.
+    """
+    numbers = np.random.default_rng(0).integers(0, 1000, 100000)
+    data = " ".join(str(number) for number in numbers).encode()
+    fname = str(path / "data.txt.bz2")
+    with open(fname, "wb") as output:
+        output.write(bz2.compress(data, compresslevel=1))
+        output.write(bz2.compress(data[:1234], compresslevel=9))
+    return fname, data + data[:1234]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_decompress(tmp_path, monkeypatch, workers):
+    "Decompress block by block and compare with the original data"
+    fname, data = make_bz2(tmp_path)
+    blocks = find_file_blocks(fname)
+    with open(fname, "rb") as source:
+        assert blocks == find_blocks(source.read())
+    # Each stream has blocks of up to 100 kB (level 1) or 900 kB (level 9)
+    assert len(blocks) == len(data[:-1234]) // 100000 + 2
+    # Make sure the serial decompression isn't used
+    monkeypatch.setattr(processors.bz2, "open", None)
+    output = ParallelDecompress(workers=workers)(fname, "download", None)
+    assert output == fname + ".decomp"
+    with open(output, "rb") as decompressed:
+        assert decompressed.read() == data
+    assert sorted(os.listdir(str(tmp_path))) == ["data.txt.bz2", "data.txt.bz2.decomp"]
+    # Existing files aren't decompressed again
+    os.remove(fname)
+    assert ParallelDecompress(workers)(fname, "fetch", None) == output
+
+
+def test_parallel_decompress_fallback(tmp_path, monkeypatch):
+    "Decompress serially if the blocks can't be decompressed"
+    fname, data = make_bz2(tmp_path)
+
+    def wrong_blocks(data):
+        "Split the first block in the wrong place"
+        blocks = find_blocks(data)
+        return [(blocks[0][0], blocks[0][1] - 8)] + blocks[1:]
+
+    monkeypatch.setattr(processors, "find_blocks", wrong_blocks)
+    output = ParallelDecompress(workers=1)(fname, "download", None)
+    with open(output, "rb") as decompressed:
+        assert decompressed.read() == data
+
+
+def test_parallel_decompress_shared_pool(tmp_path):
+    "Decompressions with the same number of workers share a spawned pool"
+    fname, data = make_bz2(tmp_path)
+    pool = get_pool(2)
+    assert get_pool(2) is pool
+    # pylint: disable=protected-access
+    assert pool._mp_context.get_start_method() == "spawn"
+    ParallelDecompress(workers=2)(fname, "download", None)
+    ParallelDecompress(workers=2)(fname, "update", None)
+    assert get_pool(2) is pool
+    with open(fname + ".decomp", "rb") as decompressed:
+        assert decompressed.read() == data
+
+
+def test_parallel_decompress_broken_pool(tmp_path, monkeypatch):
+    "Decompress serially and replace the pool if it breaks"
+
+    class BrokenPool:  # pylint: disable=too-few-public-methods
+        "Pool with a worker that was killed"
+
+        shut_down = False
+
+        def map(self, *args):
+            "Fail like a pool with a dead process"
+            raise BrokenProcessPool("A process was killed")
+
+        def shutdown(self, wait=True):  # pylint: disable=unused-argument
+            "Record that the pool was shut down"
+            self.shut_down = True
+
+    fname, data = make_bz2(tmp_path)
+    broken = BrokenPool()
+    monkeypatch.setitem(processors.POOLS, 3, broken)
+    output = ParallelDecompress(workers=3)(fname, "download", None)
+    with open(output, "rb") as decompressed:
+        assert decompressed.read() == data
+    assert broken.shut_down
+    assert 3 not in processors.POOLS
+
+
+def test_find_file_blocks_empty(tmp_path):
+    "Empty files have no blocks"
+    fname = tmp_path / "empty.bz2"
+    fname.write_bytes(b"")
+    assert find_file_blocks(str(fname)) == []
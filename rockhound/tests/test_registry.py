@@ -2,8 +2,17 @@
 Test the registry operation functions
 """
 import os
+import json
 
-from ..registry import data_location
+import pooch
+import pytest
+
+from ..registry import (
+    data_location,
+    LazyRegistry,
+    create_registry,
+    REGISTRY_FILE,
+)
 
 
 def test_data_location():
@@ -13,3 +22,71 @@ def test_data_location():
     # This is the most we can check in a platform independent way without
     # testing appdirs itself.
     assert "rockhound" in path
+
+
+def test_lazy_registry(monkeypatch, tmp_path):
+    "The registry should only be created when used"
+    monkeypatch.setenv("ROCKHOUND_DATA_DIR", str(tmp_path / "data"))
+    registry = LazyRegistry(REGISTRY_FILE)
+    assert registry.pooch is None
+    assert "PREM_1s.csv" in registry.registry
+    assert registry.pooch is not None
+    assert registry.abspath == tmp_path / "data"
+    assert registry.get() is registry.pooch
+
+
+def test_registry_cache(monkeypatch, tmp_path):
+    "The parsed registry should be loaded from the cache if it's up to date"
+    fname = str(tmp_path / "registry.txt")
+    with open(fname, "w") as output:
+        output.write("file1.txt {} http://example.com/file1.txt\n".format("a" * 64))
+    cache = str(tmp_path / "registry.json")
+    registry = create_registry(fname, cache=cache)
+    with open(cache) as cached:
+        assert json.load(cached)["registry"] == {"file1.txt": "a" * 64}
+    assert registry.registry == {"file1.txt": "a" * 64}
+    assert registry.urls == {"file1.txt": "http://example.com/file1.txt"}
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("The registry file shouldn't be parsed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(pooch.Pooch, "load_registry", fail)
+        cached = create_registry(fname, cache=cache)
+        assert cached.registry == registry.registry
+        assert cached.urls == registry.urls
+        # Changing the registry file invalidates the cache, even if the size
+        # and modification time stay the same
+        stat = os.stat(fname)
+        with open(fname, "w") as output:
+            output.write("file1.txt {} http://example.com/file3.txt\n".format("a" * 64))
+        os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        with pytest.raises(RuntimeError):
+            create_registry(fname, cache=cache)
+    assert create_registry(fname, cache=cache).urls == {
+        "file1.txt": "http://example.com/file3.txt"
+    }
+    with open(fname, "a") as output:
+        output.write("file2.txt {}\n".format("b" * 64))
+    assert set(create_registry(fname, cache=cache).registry) == {
+        "file1.txt",
+        "file2.txt",
+    }
+    monkeypatch.setenv("ROCKHOUND_REGISTRY_CACHE", cache)
+    assert LazyRegistry(fname).registry_files == ["file1.txt", "file2.txt"]
+
+
+@pytest.mark.parametrize(
+    "contents",
+    ["not json", "[1, 2]", '{"version": "x", "registry": {"a": 1}, "urls": {}}'],
+)
+def test_registry_cache_invalid(tmp_path, contents):
+    "Caches that can't be read should be ignored and replaced"
+    fname = str(tmp_path / "registry.txt")
+    with open(fname, "w") as output:
+        output.write("file1.txt {}\n".format("a" * 64))
+    cache = tmp_path / "registry.json"
+    cache.write_text(contents)
+    registry = create_registry(fname, cache=str(cache))
+    assert registry.registry == {"file1.txt": "a" * 64}
+    assert json.loads(cache.read_text())["registry"] == registry.registry
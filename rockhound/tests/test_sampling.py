@@ -0,0 +1,124 @@
+"""
+Test sampling grids at scattered points.
+"""
+import pytest
+import numpy as np
+import numpy.testing as npt
+import xarray as xr
+
+from .. import sampling
+from ..sampling import sample
+
+
+def make_grid(west=0, east=360, descending=False):
+    "Create a global grid with 0.5 degree spacing that is linear in each cell"
+    longitude = np.linspace(west, east, 2 * (east - west) + 1)
+    latitude = np.linspace(-90, 90, 361)
+    if descending:
+        latitude = latitude[::-1]
+    data = np.cos(np.radians(longitude))[np.newaxis, :] + latitude[:, np.newaxis]
+    return xr.Dataset(
+        {
+            "data": (("latitude", "longitude"), data),
+            "integer": (("latitude", "longitude"), np.ones(data.shape, dtype="int16")),
+        },
+        coords={"longitude": longitude, "latitude": latitude},
+    )
+
+
+def test_sample_nearest():
+    "Check that nearest neighbors are the grid values"
+    grid = make_grid()
+    longitude = np.array([0, 10.1, 359.9, -10.2, 180.24])
+    latitude = np.array([0, -45.1, 89.9, 30.3, -90])
+    values = sample(grid.data, longitude, latitude)
+    expected = grid.data.sel(
+        longitude=xr.DataArray(np.round(2 * (longitude % 360)) / 2),
+        latitude=xr.DataArray(np.round(2 * latitude) / 2),
+    )
+    npt.assert_allclose(values, expected)
+    # Datasets return all variables
+    values = sample(grid, longitude, latitude)
+    assert set(values) == {"data", "integer"}
+    npt.assert_allclose(values["integer"], 1)
+
+
+def test_sample_bilinear():
+    "Bilinear interpolation is exact for latitude and close for longitude"
+    grid = make_grid(-180, 180, descending=True)
+    longitude = np.linspace(-179, 179, 1000)
+    latitude = np.linspace(-89, 89, 1000)
+    values = sample(grid.data, longitude, latitude, method="bilinear")
+    npt.assert_allclose(values, np.cos(np.radians(longitude)) + latitude, atol=1e-4)
+    # Points on the grid nodes get the node values
+    values = sample(grid.data, [-180, 180, 0], [90, -90, 0], method="bilinear")
+    npt.assert_allclose(values, [89, -91, 1])
+
+
+def test_sample_dask():
+    "Sampling Dask arrays gives the same result"
+    grid = make_grid()
+    longitude = np.random.uniform(0, 360, 10000)
+    latitude = np.random.uniform(-90, 90, 10000)
+    for method in ["nearest", "bilinear"]:
+        npt.assert_allclose(
+            sample(grid.data.chunk(50), longitude, latitude, method=method),
+            sample(grid.data, longitude, latitude, method=method),
+        )
+
+
+def test_sample_lazy(tmp_path, monkeypatch):
+    "Lazily loaded grids should be read in small blocks"
+    monkeypatch.setattr(sampling, "BLOCK_SIZE", 16)
+    grid = make_grid()
+    fname = str(tmp_path / "grid.nc")
+    grid.to_netcdf(fname)
+    # Points near the corners of the grid only need the corner blocks
+    longitude = np.concatenate([np.random.uniform(0, 5, 100), [359, 359.5]])
+    latitude = np.concatenate([np.random.uniform(-90, -85, 100), [89, 90]])
+    windows = []
+    isel = xr.DataArray.isel
+
+    def recording_isel(self, *args, **kwargs):
+        windows.append(kwargs)
+        return isel(self, *args, **kwargs)
+
+    with xr.open_dataset(fname) as lazy:
+        monkeypatch.setattr(xr.DataArray, "isel", recording_isel)
+        for method in ["nearest", "bilinear"]:
+            npt.assert_allclose(
+                sample(lazy.data, longitude, latitude, method=method),
+                sample(grid.data.load(), longitude, latitude, method=method),
+            )
+    assert windows
+    for window in windows:
+        assert window["latitude"].stop - window["latitude"].start <= 16
+        assert window["longitude"].stop - window["longitude"].start <= 16
+
+
+def test_sample_outside():
+    "Points outside of regional grids are NaN"
+    grid = make_grid().sel(longitude=slice(10, 20), latitude=slice(-5, 5))
+    values = sample(grid.data, [15, 9, 21, 15, 10], [0, 0, 0, 6, -5])
+    assert np.isnan(values[1:4]).all()
+    npt.assert_allclose(
+        values[[0, 4]],
+        grid.data.sel(longitude=[15, 10], latitude=[0, -5]).values.diagonal(),
+    )
+    with pytest.raises(ValueError):
+        sample(grid.data, [1], [1], method="bla")
+
+
+def test_sample_periodic():
+    "Interpolate across the edges of global pixel-registered grids"
+    longitude = np.arange(-179.5, 180, 1)
+    latitude = np.arange(-89.5, 90, 1)
+    grid = xr.DataArray(
+        np.cos(np.radians(longitude))[np.newaxis, :] + 0 * latitude[:, np.newaxis],
+        coords={"longitude": longitude, "latitude": latitude},
+        dims=("latitude", "longitude"),
+    )
+    values = sample(grid, [179.75, -179.9, 180], [0, 0, 0], method="bilinear")
+    npt.assert_allclose(values, np.cos(np.radians(179.5)))
+    values = sample(grid, [179.9, 180.2, 0.1], [0, 0, 0])
+    npt.assert_allclose(values, np.cos(np.radians([-179.5, -179.5, 0.5])))
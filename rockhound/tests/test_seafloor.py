@@ -1,10 +1,17 @@
 """
 Test the seafloor age grids.
 """
+import os
+import bz2
+
 import pytest
+import numpy as np
 import numpy.testing as npt
+import xarray as xr
 
+import rockhound.registry
 from .. import fetch_seafloor_age
+from .utils import serve_registry
 
 
 def test_seafloor_age_file_name_only():
@@ -32,3 +39,129 @@ def test_seafloor_age():
     assert grid.uncertainty.shape == (1801, 3601)
     npt.assert_allclose([grid.age.min(), grid.age.max()], [0, 280])
     npt.assert_allclose([grid.uncertainty.min(), grid.uncertainty.max()], [0, 15])
+
+
+def age_files(scale_factor=None, add_offset=None):
+    """
+    Create compressed grids with the layout of the age grids.
+
+    Grids have a 1 degree spacing and longitudes in [0, 360]. The ages are the
+    longitude and the uncertainties are the latitude plus 90 (both multiplied
+    by 100 like the original grids). The grid points north of 80 degrees are
+    set to the fill value (like land in the original grids). If given, the
+    stored integers are encoded with the *scale_factor* and *add_offset*.
+    Returns a dictionary with the file names and contents.
+    """
+    longitude = np.linspace(0, 360, 361)
+    latitude = np.linspace(90, -90, 181)
+    values = {
+        "age": longitude[np.newaxis, :] + 0 * latitude[:, np.newaxis],
+        "ageerror": 0 * longitude[np.newaxis, :] + latitude[:, np.newaxis] + 90,
+    }
+    files = {}
+    for name, value in values.items():
+        value = 100 * value
+        attrs = {}
+        if scale_factor is not None:
+            attrs.update(scale_factor=scale_factor, add_offset=add_offset)
+            value = (value - add_offset) / scale_factor
+        value = np.where(latitude[:, np.newaxis] > 80, -99999, value)
+        grid = xr.Dataset(
+            {"z": (("y", "x"), value.astype("int32"), attrs)},
+            coords={"x": longitude, "y": latitude},
+        )
+        grid.z.encoding["_FillValue"] = -99999
+        files["{}.3.6.nc.bz2".format(name)] = bz2.compress(
+            grid.to_netcdf(format="NETCDF3_64BIT")
+        )
+    return files
+
+
+@pytest.fixture(name="fake_seafloor_age")
+def fixture_fake_seafloor_age(tmp_path, monkeypatch):
+    """
+    Serve small grids with the layout of the age grids from a local server.
+
+    See :func:`age_files` for the contents of the grids.
+    """
+    with serve_registry(tmp_path, monkeypatch, rockhound.registry, age_files()):
+        yield
+
+
+def test_seafloor_age_region(fake_seafloor_age):  # pylint: disable=unused-argument
+    "Load regions of the grids in different longitude conventions"
+    grid = fetch_seafloor_age(region=(10, 20, -5, 5))
+    npt.assert_allclose(grid.longitude, np.arange(10, 21))
+    npt.assert_allclose(grid.latitude, np.arange(5, -6, -1))
+    npt.assert_allclose(grid.age.isel(latitude=0), np.arange(10, 21))
+    npt.assert_allclose(grid.uncertainty.isel(longitude=0), np.arange(95, 84, -1))
+    assert grid.age.attrs["units"] == "million_years"
+    grid = fetch_seafloor_age(region=(-30, 30, -5, 5))
+    npt.assert_allclose(grid.longitude, np.arange(-30, 31))
+    npt.assert_allclose(grid.age.isel(latitude=0)[:30], np.arange(330, 360))
+    npt.assert_allclose(grid.age.isel(latitude=0)[31:], np.arange(1, 31))
+
+
+def test_seafloor_age_dtype(fake_seafloor_age):  # pylint: disable=unused-argument
+    "Check the data type of the grids and the lazy scaling"
+    region = (10, 20, -5, 5)
+    grid = fetch_seafloor_age(region=region)
+    assert grid.age.dtype == np.float32
+    assert grid.uncertainty.dtype == np.float32
+    grid64 = fetch_seafloor_age(region=region, dtype="float64")
+    assert grid64.age.dtype == np.float64
+    npt.assert_allclose(grid.age, grid64.age)
+    lazy = fetch_seafloor_age(lazy=True)
+    assert lazy.age.dtype == np.float32
+    assert lazy.age.encoding["scale_factor"] == np.float32(0.01)
+    assert lazy.age.attrs["units"] == "million_years"
+    npt.assert_allclose(
+        lazy.age.sel(longitude=slice(10, 20), latitude=slice(5, -5)),
+        grid.age,
+        rtol=1e-6,
+    )
+    lazy = fetch_seafloor_age(lazy=True, chunks={"longitude": 100})
+    assert lazy.age.chunks is not None
+    assert lazy.age.dtype == np.float32
+    with pytest.raises(ValueError):
+        fetch_seafloor_age(dtype="int16")
+
+
+def test_seafloor_age_fill_value(fake_seafloor_age):  # pylint: disable=unused-argument
+    "Fill values should be NaN in all ways of loading the grids"
+    for options in [{}, {"lazy": True}, {"chunks": "auto"}]:
+        grid = fetch_seafloor_age(**options)
+        assert grid.age.dtype == np.float32
+        assert np.isnan(grid.age.sel(latitude=slice(90, 81))).all()
+        assert not np.isnan(grid.age.sel(latitude=slice(80, -90))).any()
+        npt.assert_allclose(grid.age.sel(latitude=0), np.arange(361), rtol=1e-6)
+        assert "_FillValue" not in grid.age.attrs
+
+
+def test_seafloor_age_scale_offset(tmp_path, monkeypatch):
+    "Scale factors and offsets should give the same ages in all loading modes"
+    files = age_files(scale_factor=2, add_offset=-500)
+    with serve_registry(tmp_path, monkeypatch, rockhound.registry, files):
+        for options in [{}, {"lazy": True}, {"chunks": "auto"}]:
+            grid = fetch_seafloor_age(**options)
+            if options != {"lazy": True}:
+                assert grid.age.dtype == np.float32
+            npt.assert_allclose(
+                grid.age.sel(latitude=0), np.arange(361), rtol=1e-6, atol=1e-4
+            )
+            npt.assert_allclose(
+                grid.uncertainty.sel(longitude=0, latitude=slice(80, -90)),
+                np.arange(170, -1, -1),
+                atol=1e-4,
+            )
+
+
+def test_seafloor_age_chunks(fake_seafloor_age):  # pylint: disable=unused-argument
+    "Load the grids as Dask arrays"
+    grid = fetch_seafloor_age(chunks="auto")
+    assert grid.age.chunks == ((181,), (361,))
+    assert grid.age.attrs["units"] == "million_years"
+    npt.assert_allclose(grid.age.mean().compute(), 180)
+    grid = fetch_seafloor_age(chunks={"latitude": 10}, region=(-30, 30, -5, 5))
+    assert grid.uncertainty.chunks[0] == (5, 6)
+    npt.assert_allclose(grid.uncertainty.isel(longitude=0), np.arange(95, 84, -1))
@@ -2,11 +2,18 @@
 Test the Slab2 loading function.
 """
 import os
+import time
+
 import pytest
+import numpy as np
 import numpy.testing as npt
+import xarray as xr
 
+import rockhound.registry
 from .. import fetch_slab2
+from ..registry import FetchError, LazyRegistry
 from ..slab2 import ZONES, DATASETS
+from .utils import serve_directory, serve_registry, make_registry, write_files
 
 
 def test_slab2_invalid_zone():
@@ -58,3 +65,114 @@ def test_slab2():
             npt.assert_allclose(
                 dataset[element].max(), dataset[element].actual_range[1]
             )
+
+
+def test_slab2_parallel_download(tmp_path, monkeypatch):
+    "Check that the grids are downloaded concurrently from a slow server"
+    fnames = ["alu_slab2_{}.grd".format(dataset) for dataset in DATASETS]
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, fnames)
+    latency = 0.5
+    with serve_directory(served, latency=latency) as url:
+        registry = make_registry(tmp_path / "cache", url, files)
+        monkeypatch.setattr(rockhound.registry, "REGISTRY", registry)
+        start = time.time()
+        paths = fetch_slab2("alaska", load=False)
+        elapsed = time.time() - start
+    assert [os.path.basename(path) for path in paths] == fnames
+    # Downloading one after the other would take at least 5 times the latency
+    assert elapsed < 3 * latency
+    # Only one download at a time
+    with serve_directory(served, latency=0.1) as url:
+        registry = make_registry(tmp_path / "cache-serial", url, files)
+        monkeypatch.setattr(rockhound.registry, "REGISTRY", registry)
+        start = time.time()
+        fetch_slab2("alaska", load=False, workers=1)
+        assert time.time() - start >= 5 * 0.1
+
+
+def test_slab2_default_downloader(tmp_path, monkeypatch):
+    "Download concurrently through the rockhound registry and its downloader"
+    fnames = ["alu_slab2_{}.grd".format(dataset) for dataset in DATASETS]
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, fnames, size=300000)
+    # All files have the same URL path, like the real Slab2 URLs
+    latency = 0.5
+    with serve_directory(served, latency=latency, ranges=True) as url:
+        registry = LazyRegistry(None)
+        registry.pooch = make_registry(tmp_path / "cache", url, files, query=True)
+        monkeypatch.setattr(rockhound.registry, "REGISTRY", registry)
+        start = time.time()
+        paths = fetch_slab2("alaska", load=False)
+        elapsed = time.time() - start
+    # The files don't share partial files so they're downloaded concurrently
+    assert elapsed < 3 * latency
+    for fname, path in zip(fnames, paths):
+        with open(path, "rb") as downloaded, open(files[fname], "rb") as original:
+            assert downloaded.read() == original.read()
+    assert sorted(os.listdir(str(tmp_path / "cache"))) == sorted(fnames)
+
+
+def test_slab2_parallel_download_errors(tmp_path, monkeypatch):
+    "Check that the failed files are reported individually"
+    fnames = ["alu_slab2_{}.grd".format(dataset) for dataset in DATASETS]
+    served = tmp_path / "server"
+    served.mkdir()
+    files = write_files(served, fnames)
+    missing = ["alu_slab2_dip.grd", "alu_slab2_thickness.grd"]
+    with serve_directory(served) as url:
+        registry = make_registry(tmp_path / "cache", url, files)
+        for fname in missing:
+            os.remove(files[fname])
+        monkeypatch.setattr(rockhound.registry, "REGISTRY", registry)
+        with pytest.raises(FetchError) as error:
+            fetch_slab2("alaska", load=False)
+    assert set(error.value.errors) == set(missing)
+    for fname in missing:
+        assert fname in str(error.value)
+    # The files that were available were still downloaded
+    for fname in set(fnames).difference(missing):
+        assert (tmp_path / "cache" / fname).exists()
+
+
+@pytest.fixture(name="fake_slab2")
+def fixture_fake_slab2(tmp_path, monkeypatch):
+    """
+    Serve small grids with the layout of the Alaska Slab2 grids.
+
+    The value of each grid is its position in DATASETS and the thickness, depth
+    and depth uncertainty are in km, like in the original grids.
+    """
+    longitude = np.linspace(180, 200, 21)
+    latitude = np.linspace(50, 60, 11)
+    files = {}
+    for i, dataset in enumerate(DATASETS):
+        grid = xr.DataArray(
+            np.full((latitude.size, longitude.size), i, dtype="float32"),
+            coords={"x": longitude, "y": latitude},
+            dims=("y", "x"),
+            name="z",
+            attrs={"actual_range": np.array([i, i], dtype="float64")},
+        )
+        grid.x.attrs["actual_range"] = np.array([180, 200], dtype="float64")
+        grid.y.attrs["actual_range"] = np.array([50, 60], dtype="float64")
+        files["alu_slab2_{}.grd".format(dataset)] = grid.to_netcdf()
+    with serve_registry(tmp_path, monkeypatch, rockhound.registry, files):
+        yield
+
+
+def test_slab2_chunks(fake_slab2):  # pylint: disable=unused-argument
+    "Load the grids as Dask arrays"
+    eager = fetch_slab2("alaska")
+    grid = fetch_slab2("alaska", chunks={"latitude": 5})
+    for i, dataset in enumerate(DATASETS):
+        assert grid[dataset].chunks == ((5, 5, 1), (21,))
+        assert grid[dataset].units == DATASETS[dataset]["units"]
+        scale = 1000 if dataset in ("thickness", "depth", "depth_uncertainty") else 1
+        npt.assert_allclose(grid[dataset].max().compute(), i * scale)
+        npt.assert_allclose(grid[dataset].actual_range, [i * scale, i * scale])
+    xr.testing.assert_identical(grid.compute(), eager)
+    grid = fetch_slab2("alaska", chunks="auto")
+    assert grid.depth.chunks == ((11,), (21,))
@@ -0,0 +1,81 @@
+"""
+Test the utility functions for manipulating grids.
+"""
+import pytest
+import numpy as np
+import numpy.testing as npt
+import xarray as xr
+
+from ..utils import subset_region
+
+
+def make_grid(west, east, descending=False):
+    "Create a global grid with 1 degree spacing that is periodic in longitude"
+    longitude = np.linspace(west, east, east - west + 1)
+    latitude = np.linspace(-90, 90, 181)
+    if descending:
+        latitude = latitude[::-1]
+    data = np.cos(np.radians(longitude))[np.newaxis, :] + latitude[:, np.newaxis]
+    return xr.Dataset(
+        {"data": (("latitude", "longitude"), data)},
+        coords={"longitude": longitude, "latitude": latitude},
+    )
+
+
+def check_data(subset):
+    "Check that the data matches the longitudes and latitudes of the subset"
+    expected = (np.cos(np.radians(subset.longitude)) + subset.latitude).transpose(
+        "latitude", "longitude"
+    )
+    npt.assert_allclose(subset.data, expected, atol=1e-10)
+
+
+def test_subset_region():
+    "Cut regions inside the grid range"
+    grid = make_grid(-180, 180)
+    subset = subset_region(grid, (-10.5, 20, -5, 5))
+    npt.assert_allclose(subset.longitude, np.arange(-10, 21))
+    npt.assert_allclose(subset.latitude, np.arange(-5, 6))
+    check_data(subset)
+    # Descending latitudes
+    subset = subset_region(make_grid(0, 360, descending=True), (10, 20, -5, 5))
+    npt.assert_allclose(subset.latitude, np.arange(5, -6, -1))
+    npt.assert_allclose(subset.longitude, np.arange(10, 21))
+    check_data(subset)
+    # The whole grid
+    subset = subset_region(grid, (-180, 180, -90, 90))
+    xr.testing.assert_identical(subset, grid)
+
+
+def test_subset_region_longitude_conventions():
+    "Use regions in a different convention and crossing the antimeridian"
+    grid = make_grid(0, 360)
+    subset = subset_region(grid, (-30, 30, -5, 5))
+    npt.assert_allclose(subset.longitude, np.arange(-30, 31))
+    check_data(subset)
+    subset = subset_region(grid, (-30, -10, -5, 5))
+    npt.assert_allclose(subset.longitude, np.arange(-30, -9))
+    check_data(subset)
+    grid = make_grid(-180, 180)
+    subset = subset_region(grid, (170, -170, -5, 5))
+    npt.assert_allclose(subset.longitude, np.arange(170, 191))
+    check_data(subset)
+    subset = subset_region(grid, (200, 220, -5, 5))
+    npt.assert_allclose(subset.longitude, np.arange(200, 221))
+    check_data(subset)
+    subset = subset_region(grid, (0, 360, -5, 5))
+    npt.assert_allclose(subset.longitude, np.arange(0, 361))
+    check_data(subset)
+
+
+def test_subset_region_invalid():
+    "Check errors for invalid regions"
+    grid = make_grid(-180, 180)
+    with pytest.raises(ValueError):
+        subset_region(grid, (0, 10, 5))
+    with pytest.raises(ValueError):
+        subset_region(grid, (0, 10, 5, -5))
+    with pytest.raises(ValueError):
+        subset_region(grid, (-200, 180, -5, 5))
+    with pytest.raises(ValueError):
+        subset_region(grid, (0.2, 0.8, -5, 5))
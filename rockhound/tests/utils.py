@@ -0,0 +1,183 @@
+"""
+Utilities for testing downloads against a local HTTP server.
+"""
+import os
+import socket
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pooch
+
+
+def file_hash(fname):
+    "Calculate the SHA256 hash of a file"
+    sha = hashlib.sha256()
+    with open(fname, "rb") as fin:
+        sha.update(fin.read())
+    return sha.hexdigest()
+
+
+@contextmanager
+def serve_directory(
+    directory, latency=0, ranges=False, failures=0, head=True, log=None
+):
+    """
+    Serve the files in *directory* over HTTP on a random local port.
+
+    Every request waits *latency* seconds before being answered to mimic
+    a remote server. Yields the base URL of the server. If *log* is a list, the
+    method and path of every request are appended to it.
+
+    If *ranges* is True, the server answers HTTP Range requests (a single range
+    per request) and the first *failures* requests send only half of the data
+    before closing the connection to mimic a flaky link. Connections are kept
+    alive between requests (HTTP/1.1). Like the Slab2 server, requests with
+    an ``f`` query parameter (``/any/path?f=name``) get the file *name*. If
+    *head* is False, HEAD requests are rejected with a 405 error.
+    """
+
+    class Handler(SimpleHTTPRequestHandler):
+        "Serve files from the directory after a delay"
+
+        protocol_version = "HTTP/1.1"
+        requests = [] if log is None else log
+        connections = []
+        remaining_failures = [failures]
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(directory), **kwargs)
+
+        def translate_path(self, path):
+            query = parse_qs(urlsplit(path).query)
+            if "f" in query:
+                path = "/" + query["f"][0]
+            return super().translate_path(path)
+
+        def setup(self):
+            super().setup()
+            self.connections.append(self.connection)
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            self.requests.append((self.command, self.path))
+            time.sleep(latency)
+            if ranges:
+                self.send_range(body=True)
+            else:
+                super().do_GET()
+
+        def do_HEAD(self):  # pylint: disable=invalid-name
+            self.requests.append((self.command, self.path))
+            if not head:
+                self.send_error(405)
+            elif ranges:
+                self.send_range(body=False)
+            else:
+                super().do_HEAD()
+
+        def send_range(self, body):
+            "Send the part of the file given by the Range header"
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            size = os.path.getsize(path)
+            start, end = 0, size - 1
+            if "Range" in self.headers:
+                first, last = self.headers["Range"].split("=")[1].split("-")
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", "bytes {}-{}/{}".format(start, end, size)
+                )
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            if not body:
+                return
+            with open(path, "rb") as source:
+                source.seek(start)
+                data = source.read(end - start + 1)
+            if self.remaining_failures[0] > 0:
+                self.remaining_failures[0] -= 1
+                data = data[: len(data) // 2]
+                self.close_connection = True
+            self.wfile.write(data)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:{}/".format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+        # Close the connections that clients kept alive
+        for connection in Handler.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+@contextmanager
+def serve_registry(tmp_path, monkeypatch, module, files):
+    """
+    Serve files through a Pooch registry that replaces ``module.REGISTRY``.
+
+    *files* is a dictionary mapping file names to their contents (bytes). The
+    files are written to the ``server`` folder in *tmp_path* and served from
+    a local server. The registry downloads them to the ``cache`` folder.
+    Yields the registry.
+    """
+    served = tmp_path / "server"
+    served.mkdir()
+    paths = {}
+    for name, content in files.items():
+        paths[name] = str(served / name)
+        with open(paths[name], "wb") as fout:
+            fout.write(content)
+    with serve_directory(served) as url:
+        registry = make_registry(tmp_path / "cache", url, paths)
+        monkeypatch.setattr(module, "REGISTRY", registry)
+        yield registry
+
+
+def make_registry(path, base_url, files, query=False):
+    """
+    Create a Pooch registry that downloads the given files from *base_url*.
+
+    *files* is a dictionary mapping file names to the local files that are
+    being served (used to calculate the hashes). If *query*, all files have
+    the same URL path and the file name in the query string, like the Slab2
+    URLs in the registry.
+    """
+    urls = None
+    if query:
+        urls = {name: base_url + "catalog/file/get/item?f=" + name for name in files}
+    return pooch.create(
+        path=str(path),
+        base_url=base_url,
+        registry={name: file_hash(fname) for name, fname in files.items()},
+        urls=urls,
+    )
+
+
+def write_files(directory, names, size=1024):
+    "Write files with random content and return a dict with their paths"
+    files = {}
+    for name in names:
+        fname = os.path.join(str(directory), name)
+        with open(fname, "wb") as fout:
+            fout.write(os.urandom(size))
+        files[name] = fname
+    return files
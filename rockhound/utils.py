@@ -0,0 +1,134 @@
+"""
+Utility functions for manipulating the loaded grids.
+"""
+import numpy as np
+import xarray as xr
+
+
+# Names of the dimensions of the loaded grids in the netCDF files
+FILE_DIMS = {"longitude": "x", "latitude": "y"}
+
+
+def file_chunks(chunks, dims=None):
+    """
+    Convert the chunks of a loaded grid into chunks of the netCDF file.
+
+    Dictionaries can use the names of the dimensions of the loaded grid
+    (``longitude`` and ``latitude``), which are converted into the names used
+    in the files (given by *dims*). The value ``"auto"`` is converted into
+    chunks of whole rows with the number of rows chosen by Dask. This matches
+    the layout of the netCDF files, which store the grids row by row, so each
+    chunk is read in a single contiguous block.
+
+    Parameters
+    ----------
+    chunks : None, str, int, tuple or dict
+        The chunks of the loaded grid. None means that Dask isn't used.
+    dims : None or dict
+        Mapping of the names of the loaded grid dimensions to the names of the
+        dimensions in the file. Defaults to :data:`FILE_DIMS`.
+
+    Returns
+    -------
+    chunks : None, int, tuple or dict
+        The chunks that can be passed to :func:`xarray.open_dataset`.
+
+    """
+    if dims is None:
+        dims = FILE_DIMS
+    if isinstance(chunks, str) and chunks == "auto":
+        return {dims["latitude"]: "auto", dims["longitude"]: -1}
+    if isinstance(chunks, dict):
+        return {dims.get(dim, dim): size for dim, size in chunks.items()}
+    return chunks
+
+
+def subset_region(grid, region):
+    """
+    Cut a geographic region out of a grid using index slicing.
+
+    Only the rows and columns that fall inside the region are selected with
+    :meth:`xarray.Dataset.isel`. If the grid was opened lazily from a file,
+    only these parts of the file will be read and decoded.
+
+    Longitudes of the region and the grid can be in different conventions (for
+    example, [-180, 180] and [0, 360]). The longitudes of the returned grid
+    will be increasing and start at the western boundary of the region. Regions
+    can also cross the antimeridian (``west > east``, like ``(170, -170, -10,
+    10)``), in which case the two parts of the grid are joined together along
+    longitude.
+
+    Parameters
+    ----------
+    grid : :class:`xarray.Dataset` or :class:`xarray.DataArray`
+        A global grid with ``longitude`` and ``latitude`` dimensions.
+        Longitudes must be increasing.
+    region : tuple or list
+        The boundaries of the region in degrees: ``(west, east, south,
+        north)``.
+
+    Returns
+    -------
+    subset : :class:`xarray.Dataset` or :class:`xarray.DataArray`
+        The part of the grid inside the region.
+
+    """
+    if len(region) != 4:
+        raise ValueError(
+            "Invalid region '{}'. Must be (west, east, south, north).".format(region)
+        )
+    west, east, south, north = region
+    if south > north:
+        raise ValueError(
+            "Invalid region '{}'. South must be smaller than north.".format(region)
+        )
+    if east < west:
+        east += 360
+    if east - west > 360:
+        raise ValueError(
+            "Invalid region '{}'. Can't span more than 360 degrees.".format(region)
+        )
+    latitude = grid.latitude.values
+    longitude = grid.longitude.values
+    tolerance = 1e-3 * abs(longitude[1] - longitude[0])
+    rows = coordinate_slice(latitude, south, north, tolerance)
+    # Move the region into the longitude range of the grid
+    first = longitude[0] + (west - longitude[0]) % 360
+    last = first + east - west
+    columns = [coordinate_slice(longitude, first, last, tolerance)]
+    if last > longitude[-1] + tolerance:
+        # The region wraps around the end of the grid. Skip the first column
+        # if it's the same as the last (grid-line registered global grids).
+        start = 1 if abs(longitude[-1] - longitude[0] - 360) < tolerance else 0
+        end = np.searchsorted(longitude, last - 360 + tolerance, side="right")
+        columns.append(slice(start, max(start, end)))
+    pieces = []
+    for i, piece_columns in enumerate(columns):
+        piece = grid.isel(latitude=rows, longitude=piece_columns)
+        shift = west - first + 360 * i
+        if shift != 0:
+            piece = piece.assign_coords(
+                longitude=(piece.longitude + shift).assign_attrs(grid.longitude.attrs)
+            )
+        if piece.longitude.size > 0:
+            pieces.append(piece)
+    if not pieces or pieces[0].latitude.size == 0:
+        raise ValueError("Region '{}' doesn't contain any grid points.".format(region))
+    if len(pieces) == 1:
+        return pieces[0]
+    return xr.concat(pieces, dim="longitude")
+
+
+def coordinate_slice(coordinate, lower, upper, tolerance):
+    """
+    Get the slice of a monotonic coordinate array that is inside an interval.
+    """
+    if coordinate[0] <= coordinate[-1]:
+        start = np.searchsorted(coordinate, lower - tolerance, side="left")
+        end = np.searchsorted(coordinate, upper + tolerance, side="right")
+    else:
+        reversed_coordinate = coordinate[::-1]
+        size = coordinate.size
+        start = size - np.searchsorted(reversed_coordinate, upper + tolerance, "right")
+        end = size - np.searchsorted(reversed_coordinate, lower - tolerance, "left")
+    return slice(int(start), int(max(start, end)))
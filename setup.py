@@ -29,7 +29,6 @@ CLASSIFIERS = [
     "Intended Audience :: Education",
     "Topic :: Scientific/Engineering",
     "Topic :: Software Development :: Libraries",
-    "Programming Language :: Python :: 3.6",
     "Programming Language :: Python :: 3.7",
     "License :: OSI Approved :: {}".format(LICENSE),
 ]
@@ -39,7 +38,7 @@ SCRIPTS = []
 PACKAGE_DATA = {"rockhound": ["registry.txt"]}
 with open("requirements.txt") as f:
     INSTALL_REQUIRES = f.readlines()
-PYTHON_REQUIRES = ">=3.6"
+PYTHON_REQUIRES = ">=3.7"
 
 if __name__ == "__main__":
     setup(